@@ -0,0 +1,483 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+#
+# Aggregates and indexes written alongside the per-card files from documents already serialized by common.write, as
+# they arrive from the workers.
+import json
+import logging
+import os
+import unicodedata
+from argparse import ArgumentParser, Namespace
+from collections import Counter, defaultdict
+from collections.abc import Iterator
+from contextlib import ExitStack
+from tempfile import TemporaryFile
+from typing import Any, Self
+from urllib.parse import quote
+
+import bundle
+import profiling
+from common import (
+    INDEX_KEYS,
+    SerializedDocument,
+    check_output_paths,
+    expand_ruby,
+    replace_if_changed,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Destinations from add_aggregate_arguments, by attribute name
+AGGREGATE_FILES = (
+    "aggregate",
+    "aggregate_yaml",
+    "aggregate_ndjson",
+    "aggregate_index",
+    "aggregate_series",
+    "aggregate_sets",
+    "aggregate_names",
+    "aggregate_bundle",
+)
+AGGREGATE_DIRECTORIES = ("aggregate_sets_dir",)
+
+
+# Arguments for the writers in AggregateWriters. keys describes the identifiers the index and bundle are keyed by.
+def add_aggregate_arguments(parser: ArgumentParser, keys: str) -> None:
+    parser.add_argument("--aggregate", help="output aggregate JSON file")
+    parser.add_argument(
+        "--aggregate-yaml", help="output aggregate multi-document YAML file"
+    )
+    parser.add_argument(
+        "--aggregate-ndjson", help="output aggregate newline-delimited JSON file"
+    )
+    parser.add_argument(
+        "--aggregate-index",
+        help=f"output JSON index of --aggregate-ndjson line offsets by {keys}",
+    )
+    parser.add_argument(
+        "--aggregate-series",
+        help="output JSON index of the cards in each archetype or series, and the reverse",
+    )
+    parser.add_argument(
+        "--aggregate-sets",
+        help="output JSON index of the cards by set number and the printings in each set",
+    )
+    parser.add_argument(
+        "--aggregate-sets-dir",
+        help="output directory of one JSON file of printings per set, named by the percent-encoded set name",
+    )
+    parser.add_argument(
+        "--aggregate-names",
+        help="output JSON index of normalized, ruby-expanded card names for exact, prefix, and substring lookups",
+    )
+    parser.add_argument(
+        "--aggregate-bundle",
+        help=f"output aggregate binary bundle indexed by {keys}",
+    )
+
+
+# Writes the aggregate JSON array incrementally from documents already serialized by write, so the full list of cards
+# is never held in memory. The result is identical to json.dump of the list. Nothing is written if filename is None, and
+# the file is only replaced once the array is complete.
+class AggregateWriter:
+    def __init__(self, filename: str | None):
+        self.filename = filename
+        self.enabled = filename is not None
+        self.file = None
+        self.count = 0
+
+    def __enter__(self) -> Self:
+        if self.enabled:
+            logger.info(f"Write: {self.filename}")
+            self.file = open(f"{self.filename}.tmp", "w", encoding="utf-8")
+            self.file.write("[")
+        return self
+
+    def extend(self, serialized: list[SerializedDocument] | None) -> None:
+        if self.file is None or serialized is None:
+            return
+        for document in serialized:
+            if self.count:
+                self.file.write(", ")
+            self.file.write(document.json)
+            self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.file is None:
+            return
+        if exc_type is None:
+            self.file.write("]")
+            self.file.close()
+            os.replace(f"{self.filename}.tmp", self.filename)
+        else:
+            self.file.close()
+            os.remove(f"{self.filename}.tmp")
+
+
+# Writes the multi-document YAML, NDJSON, and bundle aggregates from documents already serialized by write, in the same
+# order as the per-card files sorted by name. The YAML aggregate is identical to prepending --- to every file in the
+# output directory and concatenating them. Documents arrive in the order workers finish them, so they are spooled to a
+# temporary file with only their offsets kept in memory, then copied out in order once everything is in. If two
+# documents share a basename, the last one wins, as it does for the per-card files.
+#
+# The optional index is a JSON object mapping each of INDEX_KEYS to an object from identifier to the [offset, length]
+# in bytes of the line in the NDJSON aggregate, excluding the newline, so a reader can seek straight to one card.
+class SortedAggregateWriter:
+    def __init__(
+        self,
+        yaml_filename: str | None,
+        ndjson_filename: str | None,
+        index_filename: str | None = None,
+        bundle_filename: str | None = None,
+    ):
+        self.yaml_filename = yaml_filename
+        self.ndjson_filename = ndjson_filename
+        self.index_filename = index_filename
+        self.bundle_filename = bundle_filename
+        self.enabled = bool(yaml_filename or ndjson_filename or bundle_filename)
+        self.spool = None
+        # file name: offset, YAML length, JSON length, index keys
+        self.index: dict[str, tuple[int, int, int, dict[str, list[int]]]] = {}
+
+    def __enter__(self) -> Self:
+        if self.enabled:
+            self.spool = TemporaryFile()
+        return self
+
+    def extend(self, serialized: list[SerializedDocument] | None) -> None:
+        if self.spool is None or serialized is None:
+            return
+        for document in serialized:
+            yaml_bytes = document.yaml.encode("utf-8")
+            json_bytes = document.json.encode("utf-8")
+            offset = self.spool.tell()
+            self.spool.write(yaml_bytes)
+            self.spool.write(json_bytes)
+            self.index[f"{document.basename}.yaml"] = (
+                offset,
+                len(yaml_bytes),
+                len(json_bytes),
+                document.keys,
+            )
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.spool is None:
+            return
+        with self.spool:
+            if exc_type is not None:
+                return
+            with profiling.stage("write sorted aggregates"):
+                if self.yaml_filename is not None:
+                    self.write_yaml(self.yaml_filename)
+                if self.ndjson_filename is not None:
+                    self.write_ndjson(self.ndjson_filename)
+                if self.bundle_filename is not None:
+                    self.write_bundle(self.bundle_filename)
+
+    def read_sorted(self, yaml: bool) -> Iterator[tuple[bytes, dict[str, list[int]]]]:
+        for name in sorted(self.index):
+            offset, yaml_length, json_length, keys = self.index[name]
+            if yaml:
+                self.spool.seek(offset)
+                yield self.spool.read(yaml_length), keys
+            else:
+                self.spool.seek(offset + yaml_length)
+                yield self.spool.read(json_length), keys
+
+    def write_yaml(self, filename: str) -> None:
+        logger.info(f"Write: {filename}")
+        with open(f"{filename}.tmp", "wb") as out:
+            for document, _ in self.read_sorted(yaml=True):
+                out.write(b"---\n")
+                out.write(document)
+        os.replace(f"{filename}.tmp", filename)
+
+    def write_ndjson(self, filename: str) -> None:
+        logger.info(f"Write: {filename}")
+        lines: dict[str, dict[str, list[int]]] = {key: {} for key in INDEX_KEYS}
+        with open(f"{filename}.tmp", "wb") as out:
+            for document, keys in self.read_sorted(yaml=False):
+                for kind, values in keys.items():
+                    for value in values:
+                        lines[kind][str(value)] = [out.tell(), len(document)]
+                out.write(document)
+                out.write(b"\n")
+        os.replace(f"{filename}.tmp", filename)
+        if self.index_filename is not None:
+            logger.info(f"Write: {self.index_filename}")
+            with open(self.index_filename, "w", encoding="utf-8") as out:
+                json.dump(lines, out)
+
+    def write_bundle(self, filename: str) -> None:
+        logger.info(f"Write: {filename}")
+        with open(f"{filename}.tmp", "wb") as out:
+            bundle.write_bundle(out, self.read_sorted(yaml=False), INDEX_KEYS)
+        os.replace(f"{filename}.tmp", filename)
+
+
+# Writes a JSON index of which cards are in each archetype or series, so that looking up the members of one does not
+# need a scan of every card. "members" maps each series name to an object from each of INDEX_KEYS to the identifiers of
+# its cards, and "series" maps each of INDEX_KEYS to an object from identifier to the series names of that card. Cards
+# in no series are left out.
+class SeriesIndexWriter:
+    def __init__(self, filename: str | None):
+        self.filename = filename
+        self.enabled = filename is not None
+        self.members: dict[str, dict[str, set[int]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        self.series: dict[str, dict[str, list[str]]] = {key: {} for key in INDEX_KEYS}
+
+    def __enter__(self) -> Self:
+        return self
+
+    def extend(self, serialized: list[SerializedDocument] | None) -> None:
+        if not self.enabled or serialized is None:
+            return
+        for document in serialized:
+            if not document.series:
+                continue
+            for kind, values in document.keys.items():
+                for value in values:
+                    self.series[kind][str(value)] = document.series
+                    for name in document.series:
+                        self.members[name][kind].add(value)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if not self.enabled or exc_type is not None:
+            return
+        with profiling.stage("write series index"):
+            logger.info(f"Write: {self.filename}")
+            members = {
+                name: {kind: sorted(values) for kind, values in kinds.items()}
+                for name, kinds in self.members.items()
+            }
+            with open(f"{self.filename}.tmp", "w", encoding="utf-8") as out:
+                json.dump(
+                    {"members": members, "series": self.series},
+                    out,
+                    ensure_ascii=False,
+                    sort_keys=True,
+                )
+            os.replace(f"{self.filename}.tmp", self.filename)
+
+
+# Writes a JSON index of every printing, so that looking up a set or a set number does not need a scan of every card.
+# "set_numbers" maps each set number to the identifiers (each of INDEX_KEYS) of its cards, usually just one, and
+# "set_names" maps each set name to its printings: region, set number, rarities, and the identifiers of the card.
+# Optionally also writes one JSON file per set to a directory, holding its printings, named by the percent-encoded set
+# name. Only files with different contents are written, and files for sets that no longer exist are removed.
+class SetIndexWriter:
+    def __init__(self, filename: str | None, directory: str | None = None):
+        self.filename = filename
+        self.directory = directory
+        self.enabled = filename is not None or directory is not None
+        self.set_numbers: dict[str, list[dict[str, list[int]]]] = defaultdict(list)
+        self.set_names: dict[str, list[dict[str, Any]]] = defaultdict(list)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def extend(self, serialized: list[SerializedDocument] | None) -> None:
+        if not self.enabled or serialized is None:
+            return
+        for document in serialized:
+            numbers = set()
+            for region, printings in document.sets.items():
+                for printing in printings:
+                    set_number = printing["set_number"]
+                    # Some cards list the same printing for several English-speaking regions
+                    if set_number and set_number not in numbers:
+                        numbers.add(set_number)
+                        self.set_numbers[set_number].append(document.keys)
+                    self.set_names[printing["set_name"]].append(
+                        {
+                            "region": region,
+                            "set_number": set_number,
+                            "rarities": printing["rarities"],
+                            "card": document.keys,
+                        }
+                    )
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if not self.enabled or exc_type is not None:
+            return
+        with profiling.stage("write set index"):
+            # Documents arrive in the order workers finish them
+            for printings in self.set_names.values():
+                printings.sort(key=json.dumps)
+            if self.filename is not None:
+                logger.info(f"Write: {self.filename}")
+                for cards in self.set_numbers.values():
+                    cards.sort(key=json.dumps)
+                with open(f"{self.filename}.tmp", "w", encoding="utf-8") as out:
+                    json.dump(
+                        {"set_numbers": self.set_numbers, "set_names": self.set_names},
+                        out,
+                        ensure_ascii=False,
+                        sort_keys=True,
+                    )
+                os.replace(f"{self.filename}.tmp", self.filename)
+            if self.directory is not None:
+                self.write_directory(self.directory)
+
+    def write_directory(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        counts: Counter[str] = Counter()
+        filenames = set()
+        for set_name, printings in self.set_names.items():
+            filename = f"{quote(set_name, safe=' ')}.json"
+            filenames.add(filename)
+            content = json.dumps(printings, ensure_ascii=False).encode("utf-8")
+            if replace_if_changed(os.path.join(directory, filename), content):
+                counts["written"] += 1
+            else:
+                counts["unchanged"] += 1
+        if not filenames:
+            logger.warning(f"No sets, not removing anything from {directory}")
+        for filename in os.listdir(directory) if filenames else ():
+            if filename.endswith(".json") and filename not in filenames:
+                os.remove(os.path.join(directory, filename))
+                counts["deleted"] += 1
+        logger.info(
+            f"Sets in {directory}: {counts['written']} written, "
+            f"{counts['unchanged']} unchanged, {counts['deleted']} deleted"
+        )
+
+
+# Forms of a name to look it up by: ruby expanded, NFKC-normalized, and case-folded, without duplicates
+def name_variants(name: str) -> list[str]:
+    return list(
+        dict.fromkeys(
+            unicodedata.normalize("NFKC", variant).casefold()
+            for variant in expand_ruby(name)
+        )
+    )
+
+
+# Substrings of this length index the names in each language, shorter for the scripts where one character is a word
+NGRAM_LENGTHS = {"ja": 2, "ko": 2, "zh-TW": 2, "zh-CN": 2}
+DEFAULT_NGRAM_LENGTH = 3
+
+
+# Writes a JSON index of card names for lookups without a search engine. For each key of the name object (languages
+# and romanizations), "names" is a sorted list of [variant, page IDs] over the name_variants of every card, for exact
+# and prefix matches by binary search, and "ngrams" maps each substring of a variant of NGRAM_LENGTHS to the page IDs
+# of the cards with it, as candidates for substring matches. Variants are computed here rather than in the workers,
+# which is overlapped with the workers and costs nothing when the index is not requested.
+class NameIndexWriter:
+    def __init__(self, filename: str | None):
+        self.filename = filename
+        self.enabled = filename is not None
+        self.names: dict[str, dict[str, set[int]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        self.ngrams: dict[str, dict[str, set[int]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+
+    def __enter__(self) -> Self:
+        return self
+
+    def extend(self, serialized: list[SerializedDocument] | None) -> None:
+        if not self.enabled or serialized is None:
+            return
+        with profiling.stage("name index"):
+            for document in serialized:
+                page_ids = document.keys.get("yugipedia_page_id")
+                if not page_ids:
+                    continue
+                for language, name in document.names.items():
+                    if not isinstance(name, str) or not name:
+                        continue
+                    names = self.names[language]
+                    ngrams = self.ngrams[language]
+                    length = NGRAM_LENGTHS.get(language, DEFAULT_NGRAM_LENGTH)
+                    variants = name_variants(name)
+                    for variant in variants:
+                        names[variant].update(page_ids)
+                    # Ruby expansion can give thousands of variants sharing most of their substrings
+                    for ngram in {
+                        variant[i : i + length]
+                        for variant in variants
+                        for i in range(len(variant) - length + 1)
+                    }:
+                        ngrams[ngram].update(page_ids)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if not self.enabled or exc_type is not None:
+            return
+        with profiling.stage("write name index"):
+            logger.info(f"Write: {self.filename}")
+            index = {
+                "names": {
+                    language: [
+                        [variant, sorted(names[variant])] for variant in sorted(names)
+                    ]
+                    for language, names in self.names.items()
+                },
+                "ngrams": {
+                    language: {
+                        ngram: sorted(page_ids) for ngram, page_ids in ngrams.items()
+                    }
+                    for language, ngrams in self.ngrams.items()
+                },
+            }
+            # json.dump to a file goes through the much slower pure Python encoder
+            content = json.dumps(
+                index, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+            )
+            with open(f"{self.filename}.tmp", "w", encoding="utf-8") as out:
+                out.write(content)
+            os.replace(f"{self.filename}.tmp", self.filename)
+
+
+# Checks the arguments from add_aggregate_arguments, and that neither the aggregates nor the other outputs named are in
+# the output directory
+def check_aggregate_arguments(
+    parser: ArgumentParser,
+    args: Namespace,
+    files: tuple[str, ...] = (),
+    directories: tuple[str, ...] = (),
+) -> None:
+    if args.aggregate_index and not args.aggregate_ndjson:
+        parser.error("--aggregate-index requires --aggregate-ndjson")
+    check_output_paths(
+        parser, args, AGGREGATE_FILES + files, AGGREGATE_DIRECTORIES + directories
+    )
+
+
+# Every aggregate and index from the arguments added by add_aggregate_arguments, entered and fed together
+class AggregateWriters:
+    def __init__(self, args: Namespace):
+        self.writers = (
+            AggregateWriter(args.aggregate),
+            SortedAggregateWriter(
+                args.aggregate_yaml,
+                args.aggregate_ndjson,
+                args.aggregate_index,
+                args.aggregate_bundle,
+            ),
+            SeriesIndexWriter(args.aggregate_series),
+            SetIndexWriter(args.aggregate_sets, args.aggregate_sets_dir),
+            NameIndexWriter(args.aggregate_names),
+        )
+        # Workers only need to return serialized documents if something is written from them
+        self.enabled = any(writer.enabled for writer in self.writers)
+        self.stack = None
+
+    def __enter__(self) -> Self:
+        # Writers already entered are exited if a later one fails to enter
+        with ExitStack() as stack:
+            for writer in self.writers:
+                stack.enter_context(writer)
+            self.stack = stack.pop_all()
+        return self
+
+    def extend(self, serialized: list[SerializedDocument] | None) -> None:
+        for writer in self.writers:
+            writer.extend(serialized)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stack.__exit__(exc_type, exc_value, traceback)
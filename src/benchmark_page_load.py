@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+import logging
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+from ruamel.yaml import YAML
+
+from common import page_yaml
+
+parser = ArgumentParser(
+    description="Compare loading yaml-yugipedia pages with the round-trip and safe loaders"
+)
+parser.add_argument("wikitext_directory", nargs="+", help="yaml-yugipedia pages")
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+    round_trip_yaml = YAML()
+    pages = 0
+    mismatches = 0
+    round_trip_time = 0.0
+    safe_time = 0.0
+    for directory in args.wikitext_directory:
+        for filename in sorted(os.listdir(directory)):
+            filepath = os.path.join(directory, filename)
+            if not os.path.isfile(filepath):
+                continue
+            # Read once up front so that both loaders are timed on parsing alone
+            with open(filepath) as f:
+                content = f.read()
+            start = time.perf_counter()
+            round_trip = round_trip_yaml.load(content)
+            middle = time.perf_counter()
+            safe = page_yaml.load(content)
+            end = time.perf_counter()
+            round_trip_time += middle - start
+            safe_time += end - middle
+            pages += 1
+            if (round_trip["title"], round_trip["wikitext"]) != (
+                safe["title"],
+                safe["wikitext"],
+            ):
+                mismatches += 1
+                logger.error(f"{filepath}: loaders disagree")
+    logger.info(f"{pages} pages, {mismatches} mismatches")
+    if pages:
+        logger.info(
+            f"round-trip: {round_trip_time:.3f} s ({round_trip_time / pages * 1e6:.0f} µs/page), "
+            f"safe: {safe_time:.3f} s ({safe_time / pages * 1e6:.0f} µs/page), "
+            f"speedup: {round_trip_time / safe_time:.1f}x"
+        )
+    sys.exit(min(255, mismatches))
+
+
+if __name__ == "__main__":
+    main()
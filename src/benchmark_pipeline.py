@@ -0,0 +1,324 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from io import StringIO
+from tempfile import TemporaryDirectory
+from typing import Any
+
+from ruamel.yaml import YAML
+
+import job_archetypes
+import job_ocgtcg
+import job_rush
+import job_speed
+from common import (
+    annotate_shared,
+    init_parsing,
+    initial_parse,
+    int_or_og,
+    load_page,
+    transform_multilanguage,
+    transform_names,
+    transform_sets,
+)
+
+parser = ArgumentParser(
+    description="Time each transform stage and the full jobs over a fixed sample of yaml-yugipedia pages"
+)
+PAGES = os.path.join(os.path.dirname(__file__), "benchmark", "pages")
+
+parser.add_argument(
+    "wikitext_directory",
+    nargs="?",
+    default=PAGES,
+    help="yaml-yugipedia wikitext directory containing Duel_Monsters_cards, Rush_Duel_cards, etc., "
+    "default the sample pages taken with --snapshot",
+)
+parser.add_argument(
+    "--sample",
+    default=os.path.join(os.path.dirname(__file__), "benchmark", "sample.json"),
+    help="page IDs (archetype names for TCG_and_OCG_archetypes) to benchmark",
+)
+parser.add_argument(
+    "--repeat", type=int, default=5, help="best of this many runs is reported"
+)
+parser.add_argument(
+    "--snapshot",
+    action="store_true",
+    help="copy the sample pages from wikitext_directory to check in with the benchmark, instead of benchmarking",
+)
+parser.add_argument(
+    "--fast-extraction",
+    action="store_true",
+    help="benchmark the hand-written template extraction instead of wikitextparser",
+)
+parser.add_argument("--output", help="output results JSON file")
+parser.add_argument("--compare", help="earlier results JSON file to compare against")
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_TARGETS = {
+    "Duel_Monsters_cards": "CardTable2",
+    "Rush_Duel_cards": "CardTable2",
+    "Skill_Cards": "CardTable2",
+    "TCG_and_OCG_archetypes": "Infobox archseries",
+}
+
+
+def sample_files(directory: str, keys: list[int | str], target: str) -> list[str]:
+    if target != "Infobox archseries":
+        return [os.path.join(directory, f"{page_id}.yaml") for page_id in keys]
+    # Archetype pages are listed by name, since their page IDs are not part of the output. Several pages can share a
+    # name before the parenthesized disambiguation, so an exact title wins, then the first page by file name.
+    wanted = set(keys)
+    found: dict[str, str] = {}
+    for filename in sorted(os.listdir(directory)):
+        filepath = os.path.join(directory, filename)
+        title = load_page(filepath)["title"]
+        name = title.split("(")[0].strip()
+        if name in wanted and (name not in found or title == name):
+            found[name] = filepath
+    missing = wanted - found.keys()
+    if missing:
+        raise FileNotFoundError(f"No page in {directory} for {sorted(missing)}")
+    return [found[name] for name in keys]
+
+
+# Copies the sample pages from a yaml-yugipedia checkout, so that every run benchmarks the same content rather than
+# whatever revision of those pages happens to be checked out
+def snapshot(wikitext_directory: str, sample: dict[str, list[int | str]]) -> None:
+    shutil.rmtree(PAGES, ignore_errors=True)
+    for kind, keys in sample.items():
+        os.makedirs(os.path.join(PAGES, kind))
+        source = os.path.join(wikitext_directory, kind)
+        for filepath in sample_files(source, keys, SAMPLE_TARGETS[kind]):
+            shutil.copyfile(
+                filepath, os.path.join(PAGES, kind, os.path.basename(filepath))
+            )
+        logger.info(f"Snapshot: {kind}")
+
+
+# Runs the jobs in an empty working directory each time, so that they write every file rather than finding the
+# files from the previous repeat unchanged
+@contextmanager
+def fresh_directory() -> Iterator[None]:
+    cwd = os.getcwd()
+    with TemporaryDirectory() as output:
+        os.chdir(output)
+        try:
+            yield
+        finally:
+            os.chdir(cwd)
+
+
+def best_time(
+    repeat: int,
+    function: Callable[[], Any],
+    context: Callable[[], AbstractContextManager] = nullcontext,
+) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        with context():
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    args = parser.parse_args()
+    init_parsing(None, args.fast_extraction)
+    with open(args.sample) as f:
+        sample = json.load(f)
+    if args.snapshot:
+        if os.path.abspath(args.wikitext_directory) == os.path.abspath(PAGES):
+            parser.error("--snapshot requires a yaml-yugipedia wikitext directory")
+        snapshot(args.wikitext_directory, sample)
+        return
+    if not os.path.isdir(args.wikitext_directory):
+        parser.error(
+            f"No pages in {args.wikitext_directory}; pass a yaml-yugipedia wikitext directory, or take the sample "
+            "from one with --snapshot"
+        )
+    files = {
+        kind: sample_files(
+            os.path.join(args.wikitext_directory, kind), keys, SAMPLE_TARGETS[kind]
+        )
+        for kind, keys in sample.items()
+    }
+
+    results: dict[str, dict[str, float | int]] = {}
+
+    def bench(
+        name: str,
+        cards: int,
+        function: Callable[[], Any],
+        context: Callable[[], AbstractContextManager] = nullcontext,
+    ) -> None:
+        seconds = best_time(args.repeat, function, context)
+        results[name] = {
+            "cards": cards,
+            "seconds": seconds,
+            "cards_per_second": cards / seconds,
+        }
+        logger.info(f"{name}: {cards / seconds:.0f} cards/s")
+
+    parsed = {}
+    for kind, filepaths in files.items():
+        target = SAMPLE_TARGETS[kind]
+        bench(
+            f"initial_parse[{kind}]",
+            len(filepaths),
+            lambda filepaths=filepaths, target=target: [
+                initial_parse(filepath, target) for filepath in filepaths
+            ],
+        )
+        parsed[kind] = []
+        for filepath in filepaths:
+            properties = initial_parse(filepath, target)
+            if properties:
+                page_id = int_or_og(os.path.splitext(os.path.basename(filepath))[0])
+                properties["yugipedia_page_id"] = page_id
+                parsed[kind].append(properties)
+
+    ocg = parsed["Duel_Monsters_cards"]
+    rush = [
+        properties
+        for properties in parsed["Rush_Duel_cards"]
+        if properties.get("card_type") != "Skill"
+    ]
+    skills = parsed["Skill_Cards"]
+    bench("transform_sets[ocg]", len(ocg), lambda: [transform_sets(p) for p in ocg])
+    bench("transform_names[ocg]", len(ocg), lambda: [transform_names(p) for p in ocg])
+    bench(
+        "transform_multilanguage[ocg]",
+        len(ocg),
+        lambda: [
+            (
+                transform_multilanguage(p, "text"),
+                transform_multilanguage(p, "pendulum_effect"),
+            )
+            for p in ocg
+        ],
+    )
+    bench(
+        "transform_multilanguage[rush]",
+        len(rush),
+        lambda: [
+            (
+                transform_multilanguage(p, "requirement"),
+                transform_multilanguage(p, "text"),
+            )
+            for p in rush
+        ],
+    )
+    bench(
+        "annotate_shared[ocg]", len(ocg), lambda: [annotate_shared({}, p) for p in ocg]
+    )
+    bench(
+        "annotate_shared[rush]",
+        len(rush),
+        lambda: [annotate_shared({}, p) for p in rush],
+    )
+    # Some transforms modify their input, so each run gets fresh copies
+    documents = {}
+    for name, transform, pages in (
+        ("ocg", lambda p: job_ocgtcg.transform_structure(logger, p), ocg),
+        ("rush", lambda p: job_rush.transform_structure(logger, p), rush),
+        ("speed", job_speed.transform_structure, skills),
+    ):
+        bench(
+            f"transform_structure[{name}]",
+            len(pages),
+            lambda transform=transform, pages=pages: [
+                transform(dict(p)) for p in pages
+            ],
+        )
+        documents[name] = [document for p in pages if (document := transform(dict(p)))]
+
+    yaml = YAML()
+    yaml.width = sys.maxsize
+
+    def serialize(documents: list[dict[str, Any]]) -> None:
+        for document in documents:
+            yaml.dump(document, StringIO())
+            json.dumps(document)
+
+    for name, docs in documents.items():
+        bench(f"serialize[{name}]", len(docs), lambda docs=docs: serialize(docs))
+
+    # The jobs write into the working directory
+    for name, module, kind in (
+        ("ocg", job_ocgtcg, "Duel_Monsters_cards"),
+        ("rush", job_rush, "Rush_Duel_cards"),
+        ("speed", job_speed, "Skill_Cards"),
+    ):
+        filepaths = files[kind]
+        directory = os.path.join(args.wikitext_directory, kind)
+        filenames = [os.path.basename(filepath) for filepath in filepaths]
+        bench(
+            f"job[{name}]",
+            len(filenames),
+            lambda module=module, directory=directory, filenames=filenames: module.job(
+                directory, filenames
+            ),
+            fresh_directory,
+        )
+    archetypes = files["TCG_and_OCG_archetypes"]
+    bench(
+        "job[archetypes]",
+        len(archetypes),
+        lambda: [job_archetypes.job(filepath) for filepath in archetypes],
+        fresh_directory,
+    )
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        logger.info(f"Write: {args.output}")
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        logger.info(f"Compared to {baseline['commit']}:")
+        for name, result in results.items():
+            if name in baseline["results"]:
+                ratio = (
+                    result["cards_per_second"]
+                    / baseline["results"][name]["cards_per_second"]
+                )
+                logger.info(f"{name}: {ratio:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+#
+# Compact binary aggregate of cards that can be memory-mapped and queried without loading everything.
+#
+# All integers are little-endian.
+#   Header: 8-byte magic, u16 version, u16 table count, u64 start and u64 end of the record section
+#   Table directory, one entry per table: 32-byte NUL-padded key name, u64 table offset, u64 entry count
+#   Records: u32 length followed by that many bytes of UTF-8 JSON, one per card
+#   Tables: fixed-width entries of i64 key and u64 record offset, sorted by key
+import json
+import mmap
+import struct
+import sys
+from argparse import ArgumentParser
+from collections.abc import Iterable, Iterator
+from typing import Any, BinaryIO, Self
+
+MAGIC = b"YAMLYUGI"
+VERSION = 1
+HEADER = struct.Struct("<8sHHQQ")
+DIRECTORY_ENTRY = struct.Struct("<32sQQ")
+RECORD_LENGTH = struct.Struct("<I")
+TABLE_ENTRY = struct.Struct("<qQ")
+
+
+# records are serialized JSON documents with the identifiers to index them by, e.g. {"password": [89631139]}
+def write_bundle(
+    out: BinaryIO,
+    records: Iterable[tuple[bytes, dict[str, list[int]]]],
+    kinds: Iterable[str],
+) -> int:
+    kinds = list(kinds)
+    for kind in kinds:
+        if len(kind.encode()) > DIRECTORY_ENTRY.size - 16:
+            raise ValueError(f"Key name too long for the table directory: {kind}")
+    tables: dict[str, list[tuple[int, int]]] = {kind: [] for kind in kinds}
+    records_start = HEADER.size + DIRECTORY_ENTRY.size * len(kinds)
+    out.seek(records_start)
+    offset = records_start
+    count = 0
+    for serialized, keys in records:
+        for kind, values in keys.items():
+            for value in values:
+                tables[kind].append((value, offset))
+        out.write(RECORD_LENGTH.pack(len(serialized)))
+        out.write(serialized)
+        offset += RECORD_LENGTH.size + len(serialized)
+        count += 1
+    records_end = offset
+    directory = []
+    for kind in kinds:
+        entries = sorted(tables[kind])
+        directory.append(DIRECTORY_ENTRY.pack(kind.encode(), offset, len(entries)))
+        out.writelines(TABLE_ENTRY.pack(*entry) for entry in entries)
+        offset += TABLE_ENTRY.size * len(entries)
+    out.seek(0)
+    out.write(HEADER.pack(MAGIC, VERSION, len(kinds), records_start, records_end))
+    out.writelines(directory)
+    return count
+
+
+class Bundle:
+    def __init__(self, filename: str):
+        with open(filename, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, table_count, self.records_start, self.records_end = (
+            HEADER.unpack_from(self.mmap)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filename} is not a version {VERSION} card bundle")
+        # key name: table offset, entry count
+        self.tables: dict[str, tuple[int, int]] = {}
+        for i in range(table_count):
+            name, offset, count = DIRECTORY_ENTRY.unpack_from(
+                self.mmap, HEADER.size + DIRECTORY_ENTRY.size * i
+            )
+            self.tables[name.rstrip(b"\0").decode()] = (offset, count)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.mmap.close()
+
+    def record(self, offset: int) -> bytes:
+        (length,) = RECORD_LENGTH.unpack_from(self.mmap, offset)
+        start = offset + RECORD_LENGTH.size
+        return self.mmap[start : start + length]
+
+    # Binary search over the fixed-width table, touching only the pages on the search path
+    def find(self, kind: str, key: int) -> int | None:
+        table, count = self.tables[kind]
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            value, _ = TABLE_ENTRY.unpack_from(
+                self.mmap, table + TABLE_ENTRY.size * middle
+            )
+            if value < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < count:
+            value, offset = TABLE_ENTRY.unpack_from(
+                self.mmap, table + TABLE_ENTRY.size * low
+            )
+            if value == key:
+                return offset
+
+    def get(self, kind: str, key: int) -> dict[str, Any] | None:
+        offset = self.find(kind, key)
+        if offset is not None:
+            return json.loads(self.record(offset))
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        offset = self.records_start
+        while offset < self.records_end:
+            serialized = self.record(offset)
+            yield json.loads(serialized)
+            offset += RECORD_LENGTH.size + len(serialized)
+
+
+parser = ArgumentParser(description="Look up one card in a bundle")
+parser.add_argument("bundle", help="card bundle written with --aggregate-bundle")
+parser.add_argument(
+    "kind", help="yugipedia_page_id, password, konami_id, or fake_password"
+)
+parser.add_argument("key", type=int)
+
+
+def main() -> None:
+    args = parser.parse_args()
+    with Bundle(args.bundle) as bundle:
+        if args.kind not in bundle.tables:
+            parser.error(f"{args.bundle} has no {args.kind} table")
+        card = bundle.get(args.kind, args.key)
+    if card is None:
+        sys.exit(1)
+    json.dump(card, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
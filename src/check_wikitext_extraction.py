@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+import logging
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+from common import extract_properties, extract_properties_wtp, load_page
+
+parser = ArgumentParser(
+    description="Check that the fast template extraction matches wikitextparser on every page and time both"
+)
+parser.add_argument("wikitext_directory", help="yaml-yugipedia pages")
+parser.add_argument("--target", default="CardTable2", help="template to extract")
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+    pages = 0
+    mismatches = 0
+    fast_time = 0.0
+    wtp_time = 0.0
+    for filename in sorted(os.listdir(args.wikitext_directory)):
+        filepath = os.path.join(args.wikitext_directory, filename)
+        if not os.path.isfile(filepath):
+            continue
+        document = load_page(filepath)
+        title = document["title"]
+        wikitext = document["wikitext"]
+        start = time.perf_counter()
+        fast = extract_properties(title, wikitext, args.target)
+        middle = time.perf_counter()
+        reference = extract_properties_wtp(title, wikitext, args.target)
+        end = time.perf_counter()
+        fast_time += middle - start
+        wtp_time += end - middle
+        pages += 1
+        if fast != reference:
+            mismatches += 1
+            logger.error(f"{filepath}: fast [{fast}] wikitextparser [{reference}]")
+    logger.info(f"{pages} pages, {mismatches} mismatches")
+    if pages:
+        logger.info(
+            f"fast: {fast_time:.3f} s ({fast_time / pages * 1e6:.0f} µs/page), "
+            f"wikitextparser: {wtp_time:.3f} s ({wtp_time / pages * 1e6:.0f} µs/page), "
+            f"speedup: {wtp_time / fast_time:.1f}x"
+        )
+    sys.exit(min(255, mismatches))
+
+
+if __name__ == "__main__":
+    main()
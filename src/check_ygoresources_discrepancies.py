@@ -0,0 +1,144 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+#
+# Compares card names and texts with the official database exported to yugioh-card-history, for every language in one
+# pass: each card file is read once and checked against the official data of every language it was released in. Writes
+# the same discrepancy.<language>.json reports as running check-for-ygoresources-discrepancies.ts for each language.
+import json
+import logging
+import os
+import re
+import sys
+import unicodedata
+from argparse import ArgumentParser
+from functools import partial
+from typing import Any
+
+from common import strip_ruby
+from parallel import imap_chunks
+
+LANGUAGES = ["ja", "en", "de", "es", "fr", "it", "pt"]
+
+parser = ArgumentParser(
+    description="Compare card names and texts with the official database in every language at once"
+)
+parser.add_argument("cards_directory", help="yaml-yugi data/cards")
+parser.add_argument("history_directory", help="db-ygoresources-com/yugioh-card-history")
+parser.add_argument(
+    "output_directory", help="directory to write discrepancy.<language>.json to"
+)
+parser.add_argument(
+    "--languages", nargs="+", default=LANGUAGES, help="languages to compare"
+)
+parser.add_argument(
+    "--processes", type=int, default=0, help="number of worker processes, default ncpu"
+)
+
+logger = logging.getLogger(__name__)
+
+BULLET = re.compile(r" ?● ?")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).replace("\n", "")
+    return BULLET.sub("●", text).replace("\ufffd\ufffd", "")
+
+
+def normalize_wikitext(text: str) -> str:
+    return normalize(strip_ruby(text))
+
+
+def compare(
+    card: dict[str, Any], official: dict[str, Any], language: str
+) -> dict[str, Any] | None:
+    discrepancy = {
+        "yugipedia_page_id": card["yugipedia_page_id"],
+        "konami_id": card["konami_id"],
+        "password": card["password"],
+        "name_en": card["name"]["en"],
+    }
+    wk_name = normalize_wikitext(card["name"][language])
+    db_name = normalize(official["name"])
+    if wk_name != db_name:
+        discrepancy["name"] = {"wk": wk_name, "db": db_name}
+    wk_text = normalize_wikitext(card["text"][language])
+    db_text = normalize(official["effectText"])
+    if wk_text != db_text:
+        discrepancy["text"] = {"wk": wk_text, "db": db_text}
+    if card.get("pendulum_effect"):
+        wk_pendulum = (
+            normalize_wikitext(card["pendulum_effect"][language])
+            if card["pendulum_effect"].get(language)
+            else None
+        )
+        db_pendulum = official.get("pendEffect")
+        if wk_pendulum != db_pendulum:
+            discrepancy["pendulum"] = {"wk": wk_pendulum, "db": db_pendulum}
+    if "name" in discrepancy or "text" in discrepancy or "pendulum" in discrepancy:
+        return discrepancy
+
+
+# Returns the discrepancies in each language for a chunk of card files
+def job(
+    cards_directory: str,
+    history_directory: str,
+    languages: list[str],
+    filenames: list[str],
+) -> dict[str, list[dict[str, Any]]]:
+    discrepancies = {language: [] for language in languages}
+    for filename in filenames:
+        with open(os.path.join(cards_directory, filename), encoding="utf-8") as f:
+            card = json.load(f)
+        kid = card.get("konami_id")
+        sets = card.get("sets") or {}
+        if not kid:
+            continue
+        for language in languages:
+            if not sets.get(language):
+                continue
+            path = os.path.join(history_directory, language, f"{kid}.json")
+            try:
+                with open(path, encoding="utf-8") as f:
+                    official = json.load(f)
+                discrepancy = compare(card, official, language)
+            except (OSError, TypeError, KeyError) as e:
+                # For example, not in the official database yet, or no translation on either side
+                logger.warning(
+                    f"Trying to find official data for {kid}|{card.get('password')} [{card['name']['en']}]: {e}"
+                )
+                continue
+            if discrepancy:
+                discrepancies[language].append(discrepancy)
+    return discrepancies
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+    filenames = sorted(
+        filename
+        for filename in os.listdir(args.cards_directory)
+        if filename.endswith(".json")
+    )
+    discrepancies = {language: [] for language in args.languages}
+    for chunk in imap_chunks(
+        partial(job, args.cards_directory, args.history_directory, args.languages),
+        filenames,
+        args.processes,
+        minimum_chunk=64,
+    ):
+        for language, chunk_discrepancies in chunk.items():
+            discrepancies[language].extend(chunk_discrepancies)
+    for language, language_discrepancies in discrepancies.items():
+        filename = os.path.join(args.output_directory, f"discrepancy.{language}.json")
+        logger.info(f"{language}: {len(language_discrepancies)} discrepancies")
+        logger.info(f"Write: {filename}")
+        with open(filename, "w", encoding="utf-8") as out:
+            out.write(json.dumps(language_discrepancies, ensure_ascii=False, indent=2))
+            out.write("\n")
+    # Like the per-language script, exit with the number of discrepancies so that scripts can tell there are some
+    sys.exit(min(255, sum(map(len, discrepancies.values()))))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,41 @@
-# SPDX-FileCopyrightText: © 2022–2025 Kevin Lu
+# SPDX-FileCopyrightText: © 2022–2026 Kevin Lu
 # SPDX-Licence-Identifier: AGPL-3.0-or-later
+import hashlib
 import json
 import logging
+import os
+import re
+from argparse import ArgumentParser, Namespace
+from collections import Counter
+from collections.abc import Iterable, Iterator
 from csv import DictReader
-from typing import Any
+from io import StringIO
+from itertools import pairwise
+from tempfile import NamedTemporaryFile
+from typing import Any, NamedTuple
 
+import fastjsonschema
+import ruamel.yaml
 import wikitextparser as wtp
+from genson import SchemaBuilder
 from ruamel.yaml import YAML
 from ruamel.yaml.scalarstring import LiteralScalarString
 
+import parse_cache
+import profiling
+from digest import file_digest, json_digest
+from pipeline import BackgroundWriter
+
 logger = logging.getLogger(__name__)
 
 
+# Prefixes messages with the card being transformed. Unlike Logger.getChild, creating one does not register a new
+# logger for the rest of the run.
+class CardLogger(logging.LoggerAdapter):
+    def process(self, msg: Any, kwargs: Any) -> tuple[str, Any]:
+        return f"{self.extra['card']}: {msg}", kwargs
+
+
 # Mapping of English names for languages used by Template:Unofficial name and Template:Unofficial lore
 # to ISO 639-1 language codes used in our output structure
 UNOFFICIAL_LANGUAGES = {
@@ -53,13 +77,11 @@ def expand_templates(template: wtp.Template) -> str:
         return ""
 
 
-def initial_parse(
-    yaml: YAML, yaml_file: str, target: str = "CardTable2"
+def extract_properties_wtp(
+    title: str, wikitext: str, target: str
 ) -> dict[str, str] | None:
-    with open(yaml_file) as f:
-        document = yaml.load(f)
-    properties = {"title": document["title"]}
-    wikitext = wtp.parse(document["wikitext"])
+    properties = {"title": title}
+    wikitext = wtp.parse(wikitext)
     if not len(wikitext.templates):
         return
     for template in wikitext.templates:
@@ -79,6 +101,179 @@ def initial_parse(
         if value == "":
             continue
         properties[name] = value
+    return properties
+
+
+class UnsupportedWikitext(ValueError):
+    pass
+
+
+COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+TEMPLATE_TOKENS = re.compile(r"\{\{|\}\}|\[\[|\]\]|\|")
+ARGUMENT_TOKENS = re.compile(r"\{\{|\}\}|\[\[|\]\]|=")
+# Template parameters and extension tags like <nowiki> and <ref> change how pipes and braces are interpreted, so pages
+# using them before the end of the target template are left to wikitextparser. Unterminated comments also end up here.
+UNSUPPORTED_MARKUP = re.compile(r"\{\{\{|<(?!br ?/?>)[a-z/!]", re.IGNORECASE)
+# Anything wtp.remove_markup would change. Other argument values are used as-is.
+MARKUP = re.compile(r"[{\[<&]|''")
+
+
+# Splits the top-level arguments of a template found by extract_properties, following wikitextparser conventions:
+# the name of a named argument ends at the first = not inside a nested template or link, and positional arguments
+# are named by their one-based position.
+def split_template_arguments(
+    wikitext: str, shadow: str, end: int, pipes: list[int]
+) -> list[tuple[str, str]]:
+    arguments = []
+    positional = 0
+    bounds = [*pipes, end - 2]
+    for pipe, stop in pairwise(bounds):
+        depth = 0
+        for match in ARGUMENT_TOKENS.finditer(shadow, pipe + 1, stop):
+            token = match.group()
+            if token == "=":
+                if depth == 0:
+                    name = wikitext[pipe + 1 : match.start()]
+                    arguments.append((name, wikitext[match.end() : stop]))
+                    break
+            elif token == "{{" or token == "[[":
+                depth += 1
+            else:
+                depth -= 1
+        else:
+            positional += 1
+            arguments.append((str(positional), wikitext[pipe + 1 : stop]))
+    return arguments
+
+
+# Equivalent to extract_properties_wtp, but locates the target template with a single bracket-matching scan instead
+# of parsing every template on the page, and only runs wtp.remove_markup on argument values that contain markup.
+def extract_properties(title: str, wikitext: str, target: str) -> dict[str, str] | None:
+    # Same length as the original, so offsets carry over, but with the contents of comments hidden
+    shadow = COMMENT.sub(lambda match: " " * len(match.group()), wikitext)
+    # (start, end, pipe offsets) of each complete template, and the same for templates and links still open
+    templates: list[tuple[int, int, list[int]]] = []
+    stack: list[tuple[str, int, list[int]]] = []
+    found = False
+    try:
+        for match in TEMPLATE_TOKENS.finditer(shadow):
+            token = match.group()
+            if token == "{{" or token == "[[":
+                stack.append((token, match.start(), []))
+            elif token == "|":
+                if stack and stack[-1][0] == "{{":
+                    stack[-1][2].append(match.start())
+            elif stack:  # closing brackets without an opening are plain text
+                opening, start, pipes = stack.pop()
+                if opening != ("{{" if token == "}}" else "[["):
+                    raise UnsupportedWikitext(title)
+                if token == "}}":
+                    templates.append((start, match.end(), pipes))
+                    found = (
+                        found
+                        or template_name(wikitext, start, match.end(), pipes) == target
+                    )
+                    if found and not stack:
+                        break
+        else:
+            if stack:
+                raise UnsupportedWikitext(title)
+        if UNSUPPORTED_MARKUP.search(shadow, 0, match.end() if found else len(shadow)):
+            raise UnsupportedWikitext(title)
+    except UnsupportedWikitext:
+        logger.debug("Falling back to wikitextparser: %s", title)
+        with profiling.stage("wikitextparser fallback"):
+            return extract_properties_wtp(title, wikitext, target)
+    if not found:
+        return
+
+    properties = {"title": title}
+    templates.sort()
+    for start, end, pipes in templates:
+        name = template_name(wikitext, start, end, pipes)
+        if name == target:
+            break
+        elif name == "Unofficial name" or name == "Unofficial lore":
+            languages = split_template_arguments(wikitext, shadow, end, pipes)[0][1]
+            flags = properties.setdefault("is_translation_unofficial", {})
+            flags = flags.setdefault(
+                "name" if name == "Unofficial name" else "text", {}
+            )
+            for lang in languages.split(","):
+                flags[UNOFFICIAL_LANGUAGES[lang.strip()]] = True
+    for name, value in split_template_arguments(wikitext, shadow, end, pipes):
+        name = name.strip()
+        value = value.strip().replace("<br />", "\n").replace("<br/>", "\n")
+        if MARKUP.search(value):
+            with profiling.stage("expand templates"):
+                value = recursive_expand_templates(value)
+        else:
+            value = value.strip()
+        if value == "":
+            continue
+        properties[name] = value
+    return properties
+
+
+def template_name(wikitext: str, start: int, end: int, pipes: list[int]) -> str:
+    return wikitext[start + 2 : pipes[0] if pipes else end - 2].strip()
+
+
+# yaml-yugipedia pages are plain mappings of title and wikitext, so there is no need for the round-trip loader used
+# for output. The safe loader is backed by the libyaml-based C parser from ruamel.yaml.clib.
+page_yaml = YAML(typ="safe")
+
+
+def load_page(yaml_file: str) -> dict[str, Any]:
+    with open(yaml_file) as f:
+        return page_yaml.load(f)
+
+
+# extract_properties has only been checked against wikitextparser on a sample of pages, so it is opt-in
+fast_extraction = False
+
+
+# Called in the parent and in every worker, with the parse cache SQLite file if any. Anything that could change what
+# initial_parse returns for the same page is part of the version, so that entries from older code are never used.
+def init_parsing(parse_cache_file: str | None, fast: bool = False) -> None:
+    global fast_extraction
+    fast_extraction = fast
+    parse_cache.enable(
+        parse_cache_file,
+        json_digest(
+            [file_digest(__file__), wtp.__version__, ruamel.yaml.__version__, fast]
+        ),
+    )
+
+
+# content is the page file if it was already read, e.g. by a Prefetcher
+def initial_parse(
+    yaml_file: str, target: str = "CardTable2", content: bytes | None = None
+) -> dict[str, str] | None:
+    if content is None:
+        with open(yaml_file, "rb") as f:
+            content = f.read()
+    if parse_cache.connection:
+        page_key = parse_cache.key(content, target)
+        with profiling.stage("parse cache lookup"):
+            properties = parse_cache.get(page_key)
+        if properties is not parse_cache.MISS:
+            return properties
+    with profiling.stage("load page"):
+        document = page_yaml.load(content)
+    properties = parse_page(document, target)
+    if parse_cache.connection:
+        with profiling.stage("parse cache store"):
+            parse_cache.put(page_key, properties)
+    return properties
+
+
+def parse_page(document: dict[str, Any], target: str) -> dict[str, str] | None:
+    with profiling.stage("extract template"):
+        extract = extract_properties if fast_extraction else extract_properties_wtp
+        properties = extract(document["title"], document["wikitext"], target)
+    if not properties:
+        return
 
     if "name" in properties:
         properties["en_name"] = properties.pop("name")
@@ -106,7 +301,9 @@ def int_or_og(val: str) -> int | str:
 
 def str_or_none(val: str | None) -> LiteralScalarString | None:
     if val:
-        return LiteralScalarString(val)
+        # Same as LiteralScalarString(val), but skips the Python-level constructors that only handle YAML anchors.
+        # They dominated the time spent in transform_multilanguage.
+        return str.__new__(LiteralScalarString, val)
 
 
 # Parses a wikitext sets field value
@@ -190,35 +387,64 @@ def transform_image(image: str) -> list[dict[str, str]]:
     return [transform_image_entry(entry) for entry in tokens]
 
 
+# Output language codes in order, with the prefix of the corresponding CardTable2 parameters, e.g. de_lore.
+# Adding a language here adds it to every multilingual field.
+LANGUAGE_PREFIXES = {
+    "en": "",
+    "de": "de_",
+    "es": "es_",
+    "fr": "fr_",
+    "it": "it_",
+    "pt": "pt_",
+    "ja": "ja_",
+    "ko": "ko_",
+    "zh-TW": "tc_",
+    "zh-CN": "sc_",
+}
+# Romanized names that follow the name in their language
+NAME_ROMANIZATIONS = {
+    "ja": (("ja_romaji", "romaji_name"),),
+    "ko": (("ko_rr", "ko_rr_name"),),
+}
+
+
+# (output language, source key) pairs for a field, e.g. ("de", "de_pendulum_effect")
+def language_fields(base: str) -> tuple[tuple[str, str], ...]:
+    return tuple(
+        (language, f"{prefix}{base}") for language, prefix in LANGUAGE_PREFIXES.items()
+    )
+
+
+# Built once instead of formatting every source key for every card
+LANGUAGE_FIELDS = {
+    base: language_fields(base)
+    for base in (
+        "text",
+        "pendulum_effect",
+        "requirement",
+        "condition",
+        "materials",
+        "skill_activation",
+    )
+}
+# initial_parse renames the English name parameter to en_name
+NAME_FIELDS = (("en", "en_name"),) + tuple(
+    field
+    for language, key in language_fields("name")
+    if language != "en"
+    for field in ((language, key), *NAME_ROMANIZATIONS.get(language, ()))
+)
+
+
 def transform_names(wikitext: dict[str, str]) -> dict[str, str]:
-    return {
-        "en": wikitext["en_name"],
-        "de": wikitext.get("de_name"),
-        "es": wikitext.get("es_name"),
-        "fr": wikitext.get("fr_name"),
-        "it": wikitext.get("it_name"),
-        "pt": wikitext.get("pt_name"),
-        "ja": wikitext.get("ja_name"),
-        "ja_romaji": wikitext.get("romaji_name"),
-        "ko": wikitext.get("ko_name"),
-        "ko_rr": wikitext.get("ko_rr_name"),
-        "zh-TW": wikitext.get("tc_name"),
-        "zh-CN": wikitext.get("sc_name"),
-    }
+    get = wikitext.get
+    return {language: get(key) for language, key in NAME_FIELDS}
 
 
 def transform_multilanguage(wikitext: dict[str, str], basename: str) -> dict[str, str]:
+    get = wikitext.get
     return {
-        "en": str_or_none(wikitext.get(basename)),
-        "de": str_or_none(wikitext.get(f"de_{basename}")),
-        "es": str_or_none(wikitext.get(f"es_{basename}")),
-        "fr": str_or_none(wikitext.get(f"fr_{basename}")),
-        "it": str_or_none(wikitext.get(f"it_{basename}")),
-        "pt": str_or_none(wikitext.get(f"pt_{basename}")),
-        "ja": str_or_none(wikitext.get(f"ja_{basename}")),
-        "ko": str_or_none(wikitext.get(f"ko_{basename}")),
-        "zh-TW": str_or_none(wikitext.get(f"tc_{basename}")),
-        "zh-CN": str_or_none(wikitext.get(f"sc_{basename}")),
+        language: str_or_none(get(key)) for language, key in LANGUAGE_FIELDS[basename]
     }
 
 
@@ -260,18 +486,9 @@ def annotate_shared(document: dict[str, Any], wikitext: dict[str, str]) -> None:
             document["def"] = int_or_og(wikitext["def"])
         if "pendulum_scale" in wikitext:
             document["pendulum_scale"] = int(wikitext["pendulum_scale"])
-            document["pendulum_effect"] = {
-                "en": str_or_none(wikitext.get("pendulum_effect")),
-                "de": str_or_none(wikitext.get("de_pendulum_effect")),
-                "es": str_or_none(wikitext.get("es_pendulum_effect")),
-                "fr": str_or_none(wikitext.get("fr_pendulum_effect")),
-                "it": str_or_none(wikitext.get("it_pendulum_effect")),
-                "pt": str_or_none(wikitext.get("pt_pendulum_effect")),
-                "ja": str_or_none(wikitext.get("ja_pendulum_effect")),
-                "ko": str_or_none(wikitext.get("ko_pendulum_effect")),
-                "zh-TW": str_or_none(wikitext.get("tc_pendulum_effect")),
-                "zh-CN": str_or_none(wikitext.get("sc_pendulum_effect")),
-            }
+            document["pendulum_effect"] = transform_multilanguage(
+                wikitext, "pendulum_effect"
+            )
         # bonus derived fields
         if "ritualcard" in wikitext:
             document["ritual_spell"] = wikitext["ritualcard"]
@@ -289,13 +506,327 @@ def annotate_shared(document: dict[str, Any], wikitext: dict[str, str]) -> None:
         # references card names (an archetype), e.g. https://twitter.com/YuGiOh_OCG_INFO/status/690088046025445376
 
 
-def write(obj: Any, basename: str, yaml: YAML, logger: logging.Logger) -> None:
-    logger.info(f"Write: {basename}.yaml")
-    with open(f"{basename}.yaml", mode="w", encoding="utf-8") as out:
-        yaml.dump(obj, out)
-    logger.info(f"Write: {basename}.json")
-    with open(f"{basename}.json", mode="w", encoding="utf-8") as out:
-        json.dump(obj, out)
+class WriteStats(NamedTuple):
+    # Every basename written or found unchanged in this run; other outputs in the directory are stale
+    basenames: set[str]
+    # written, unchanged, deleted
+    counts: Counter[str]
+    # basename: schema validation error, for documents that failed with --schema
+    failures: dict[str, str]
+
+
+# The contents of the per-card files produced by write, returned so that aggregates can reuse them
+class SerializedDocument(NamedTuple):
+    basename: str
+    yaml: str
+    json: str
+    # Identifiers to look the document up by in the aggregate indexes
+    keys: dict[str, list[int]]
+    # Archetypes and series the card is a member of, for the series index
+    series: list[str]
+    # Printings by region, as from transform_sets, for the set index
+    sets: dict[str, list[dict[str, Any]]]
+    # Names by language, for the name index
+    names: dict[str, str]
+
+
+INDEX_KEYS = ("yugipedia_page_id", "password", "konami_id", "fake_password")
+
+
+def index_keys(obj: Any) -> dict[str, list[int]]:
+    if not isinstance(obj, dict):
+        return {}
+    keys = {}
+    for key in INDEX_KEYS:
+        value = obj.get(key)
+        if isinstance(value, int):
+            keys[key] = [value]
+        elif isinstance(value, list):
+            # Some prereleases are assigned a fake password from each of several ranges
+            keys[key] = value
+    return keys
+
+
+def document_series(obj: Any) -> list[str]:
+    return (obj.get("series") or []) if isinstance(obj, dict) else []
+
+
+def document_sets(obj: Any) -> dict[str, list[dict[str, Any]]]:
+    return (obj.get("sets") or {}) if isinstance(obj, dict) else {}
+
+
+def document_names(obj: Any) -> dict[str, str]:
+    return (obj.get("name") or {}) if isinstance(obj, dict) else {}
+
+
+def merge_write_stats(stats: WriteStats, other: WriteStats) -> None:
+    stats.basenames.update(other.basenames)
+    stats.counts.update(other.counts)
+    stats.failures.update(other.failures)
+
+
+# Set in each process by enable_validation, since compiled validators cannot be pickled
+validator: Any = None
+
+
+def load_schema(filename: str | None) -> dict[str, Any] | None:
+    if filename:
+        with open(filename) as f:
+            return json.load(f)
+
+
+# Called in every worker. Without use_default, validation never fills in defaults and changes the document.
+def enable_validation(schema: dict[str, Any] | None) -> None:
+    global validator
+    if schema:
+        validator = fastjsonschema.compile(schema, use_default=False)
+
+
+# NamedTemporaryFile creates files only the owner can read, unlike open
+UMASK = os.umask(0)
+os.umask(UMASK)
+FILE_MODE = 0o666 & ~UMASK
+
+
+# Leaves the file alone if it already has this content, so that unchanged outputs keep their mtime and git does not
+# need to rehash them. Otherwise, replaces it atomically. Returns whether the file was written.
+def replace_if_changed(filename: str, content: bytes) -> bool:
+    try:
+        if os.path.getsize(filename) == len(content):
+            with open(filename, "rb") as f:
+                if f.read() == content:
+                    return False
+    except FileNotFoundError:
+        pass
+    # A unique name in the same directory, so that outputs with the same basename never share one, removed again if
+    # the write fails
+    with NamedTemporaryFile(
+        dir=os.path.dirname(filename) or ".",
+        prefix=f".{os.path.basename(filename)}.",
+        suffix=".tmp",
+        delete=False,
+    ) as out:
+        try:
+            out.write(content)
+            out.close()
+            os.chmod(out.name, FILE_MODE)
+            os.replace(out.name, filename)
+        except BaseException:
+            os.remove(out.name)
+            raise
+    return True
+
+
+# Returns written or unchanged
+def write_file(
+    filename: str, content: bytes, logger: logging.Logger | logging.LoggerAdapter
+) -> str:
+    with profiling.stage("write files"):
+        changed = replace_if_changed(filename, content)
+    if changed:
+        logger.debug("Write: %s", filename)
+        return "written"
+    logger.debug("Unchanged: %s", filename)
+    return "unchanged"
+
+
+# With writer, the files are written in its background thread, which counts the outcomes instead of stats
+def write(
+    obj: Any,
+    basename: str,
+    yaml: YAML,
+    logger: logging.Logger | logging.LoggerAdapter,
+    stats: WriteStats | None = None,
+    writer: BackgroundWriter | None = None,
+) -> SerializedDocument:
+    # Failed documents are still written so the whole run can be inspected, but the main scripts then exit with an error
+    if validator:
+        with profiling.stage("validate"):
+            try:
+                validator(obj)
+            except fastjsonschema.JsonSchemaValueException as e:
+                logger.debug("Invalid: %s", e.message)
+                if stats:
+                    stats.failures[str(basename)] = e.message
+    with profiling.stage("serialize YAML"):
+        buffer = StringIO()
+        yaml.dump(obj, buffer)
+    with profiling.stage("serialize JSON"):
+        serialized = SerializedDocument(
+            str(basename),
+            buffer.getvalue(),
+            json.dumps(obj),
+            index_keys(obj),
+            document_series(obj),
+            document_sets(obj),
+            document_names(obj),
+        )
+    for filename, content in (
+        (f"{basename}.yaml", serialized.yaml),
+        (f"{basename}.json", serialized.json),
+    ):
+        if writer:
+            writer.put(filename, content.encode("utf-8"), logger)
+            continue
+        outcome = write_file(filename, content.encode("utf-8"), logger)
+        if stats:
+            stats.counts[outcome] += 1
+    if stats:
+        stats.basenames.add(str(basename))
+    return serialized
+
+
+# Content hashes of the per-card files of a document, recorded in the manifest to detect outputs changed since
+def serialized_digests(serialized: SerializedDocument) -> list[str]:
+    return [
+        hashlib.sha256(serialized.yaml.encode("utf-8")).hexdigest(),
+        hashlib.sha256(serialized.json.encode("utf-8")).hexdigest(),
+    ]
+
+
+# Reads back the per-card files that write produced in an earlier run, returning None if either is missing or no
+# longer matches the digests recorded when they were written. Only parses them when parse is set.
+def read_serialized(
+    basename: str, digests: list[str] | None, parse: bool = True
+) -> SerializedDocument | None:
+    try:
+        with open(f"{basename}.yaml", "rb") as f:
+            yaml_bytes = f.read()
+        with open(f"{basename}.json", "rb") as f:
+            json_bytes = f.read()
+    except FileNotFoundError:
+        return None
+    if digests != [
+        hashlib.sha256(yaml_bytes).hexdigest(),
+        hashlib.sha256(json_bytes).hexdigest(),
+    ]:
+        return None
+    yaml_text = yaml_bytes.decode("utf-8")
+    json_text = json_bytes.decode("utf-8")
+    if not parse:
+        return SerializedDocument(basename, yaml_text, json_text, {}, [], {}, {})
+    obj = json.loads(json_text)
+    return SerializedDocument(
+        basename,
+        yaml_text,
+        json_text,
+        index_keys(obj),
+        document_series(obj),
+        document_sets(obj),
+        document_names(obj),
+    )
+
+
+# Basenames of the per-card files the last run wrote to the working directory, one per line. Only files named in it, or
+# in the previous manifest, are ever removed, so nothing else that happens to be in the directory is touched.
+OUTPUTS_RECORD = ".outputs"
+
+
+def load_outputs_record() -> set[str]:
+    try:
+        with open(OUTPUTS_RECORD, encoding="utf-8") as f:
+            return set(f.read().splitlines())
+    except FileNotFoundError:
+        logger.info(
+            f"No {OUTPUTS_RECORD} in the output directory, earlier outputs unknown"
+        )
+        return set()
+
+
+# Remove outputs that an earlier run wrote but this one did not, e.g. for deleted pages or changed passwords, then
+# record what this run wrote. This replaces deleting everything before the transform, which would make every file
+# look new to git.
+def remove_stale_outputs(stats: WriteStats, previous: Iterable[str] = ()) -> None:
+    if not stats.basenames:
+        logger.warning("Nothing was written, not removing any outputs")
+        return
+    for basename in sorted(load_outputs_record().union(previous) - stats.basenames):
+        for filename in (f"{basename}.yaml", f"{basename}.json"):
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                continue
+            logger.info(f"Remove: {filename}")
+            stats.counts["deleted"] += 1
+    record = "".join(f"{basename}\n" for basename in sorted(stats.basenames))
+    replace_if_changed(OUTPUTS_RECORD, record.encode("utf-8"))
+
+
+# Per-card files are written to the working directory and stale ones removed from it, so refuse to put any other
+# output there, where it could be overwritten by or mistaken for a card
+def check_output_paths(
+    parser: ArgumentParser,
+    args: Namespace,
+    files: Iterable[str],
+    directories: Iterable[str] = (),
+) -> None:
+    cwd = os.getcwd()
+    for name in files:
+        path = getattr(args, name, None)
+        if path is not None and os.path.dirname(os.path.abspath(path)) == cwd:
+            parser.error(
+                f"--{name.replace('_', '-')} must be outside the output directory {cwd}"
+            )
+    for name in directories:
+        path = getattr(args, name, None)
+        if path is not None and os.path.abspath(path) == cwd:
+            parser.error(
+                f"--{name.replace('_', '-')} must not be the output directory {cwd}"
+            )
+
+
+def object_schemas(schema: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    nodes: list[Any] = [schema]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, dict):
+            types = node.get("type")
+            if types == "object" or isinstance(types, list) and "object" in types:
+                yield node
+            nodes.extend(node.values())
+        elif isinstance(node, list):
+            nodes.extend(node)
+
+
+# genson leaves out empty required lists, which add_schema then takes to mean unknown rather than none. The merged
+# schema would then require keys that only some chunks of work always had, so spell them out before merging.
+def partial_schema(builder: SchemaBuilder) -> dict[str, Any]:
+    schema = builder.to_schema()
+    for node in object_schemas(schema):
+        node.setdefault("required", [])
+    return schema
+
+
+# builder has the partial schemas generated by every chunk of work added to it. The output is the same as if every
+# document had been added to one builder.
+def save_generated_schema(filename: str, builder: SchemaBuilder) -> None:
+    schema = builder.to_schema()
+    for node in object_schemas(schema):
+        if node.get("required") == []:
+            del node["required"]
+    logger.info(f"Write: {filename}")
+    with open(filename, "w", encoding="utf-8") as out:
+        json.dump(schema, out, indent=2)
+        out.write("\n")
+
+
+# Written even if nothing failed, so that a report from an earlier run does not linger
+def save_validation_report(filename: str, failures: dict[str, str]) -> None:
+    logger.info(f"Write: {filename}")
+    with open(filename, "w", encoding="utf-8") as out:
+        json.dump(dict(sorted(failures.items())), out, indent=2)
+
+
+def log_write_stats(stats: WriteStats) -> None:
+    logger.info(
+        f"Files written: {stats.counts['written']}, "
+        f"unchanged: {stats.counts['unchanged']}, "
+        f"deleted: {stats.counts['deleted']}"
+    )
+    for basename, message in sorted(stats.failures.items()):
+        logger.error(f"{basename}: {message}")
+    if stats.failures:
+        logger.error(f"{len(stats.failures)} document(s) failed schema validation")
 
 
 def load_ko_csv(key: str, filename: str | None) -> dict[int, dict[str, str]] | None:
@@ -315,9 +846,76 @@ def replace_interlinear_annotations(name: str) -> str:
     )
 
 
+# Ruby markup as produced by expand_templates and replace_interlinear_annotations
+RUBY = re.compile(r"<ruby>(.*?)<rt>(.*?)</rt></ruby>")
+
+
+# Every combination of base text and ruby for each <ruby> in the name, the base text alone first
+def expand_ruby(name: str) -> list[str]:
+    if "<ruby>" not in name:
+        return [name]
+    results = [""]
+    position = 0
+    for match in RUBY.finditer(name):
+        text = name[position : match.start()]
+        base, ruby = match.groups()
+        results = [result + text + base for result in results] + [
+            result + text + ruby for result in results
+        ]
+        position = match.end()
+    tail = name[position:]
+    return [result + tail for result in results]
+
+
+# Only the base text of each <ruby> in the name, the first of expand_ruby without the combinations
+def strip_ruby(name: str) -> str:
+    return RUBY.sub(r"\1", name) if "<ruby>" in name else name
+
+
 def load_unreleased_csv(filename: str | None) -> dict[str, dict[str, str]]:
     if not filename:
         return {}
     with open(filename) as f:
         reader = DictReader(f)
         return {row["English name"]: row for row in reader}
+
+
+# Identifies the code and configuration that produced a manifest, so that changing either forces a full transform
+def manifest_fingerprint(sources: list[str], options: dict[str, Any]) -> str:
+    return json_digest(
+        {
+            "sources": [file_digest(source) for source in sources],
+            # The output also depends on how these parse and serialize
+            "libraries": {
+                "ruamel.yaml": ruamel.yaml.__version__,
+                "wikitextparser": wtp.__version__,
+                "fastjsonschema": fastjsonschema.VERSION,
+            },
+            "options": options,
+        }
+    )
+
+
+# The manifest records, for every input file, the content hash and whatever is needed to decide whether the output
+# from the previous run can be reused. Returns an empty mapping if there is no usable manifest.
+def load_manifest(filename: str, fingerprint: str) -> dict[str, dict[str, Any]]:
+    try:
+        with open(filename) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        logger.info(f"No manifest at {filename}, transforming everything")
+        return {}
+    if manifest.get("fingerprint") != fingerprint:
+        logger.info(
+            "Code or options changed since the manifest, transforming everything"
+        )
+        return {}
+    return manifest["files"]
+
+
+def save_manifest(
+    filename: str, fingerprint: str, files: dict[str, dict[str, Any]]
+) -> None:
+    logger.info(f"Write: {filename}")
+    with open(filename, "w", encoding="utf-8") as out:
+        json.dump({"fingerprint": fingerprint, "files": files}, out, sort_keys=True)
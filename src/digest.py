@@ -0,0 +1,19 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+#
+# Content hashes for manifests and caches. Only the standard library, so that scripts like test_data_validation.py can
+# use them without importing the transform.
+import hashlib
+import json
+from typing import Any
+
+
+def file_digest(filename: str) -> str:
+    with open(filename, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def json_digest(obj: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str).encode()
+    ).hexdigest()
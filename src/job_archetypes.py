@@ -0,0 +1,31 @@
+# SPDX-FileCopyrightText: © 2022–2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+import logging
+from multiprocessing import current_process
+
+from common import initial_parse
+
+module_logger = logging.getLogger(__name__)
+
+
+def job(filepath: str) -> tuple[str, dict[str, str | None]] | None:
+    logger = module_logger.getChild(current_process().name)
+    logger.debug(filepath)
+    properties = initial_parse(filepath, "Infobox archseries")
+    if not properties:
+        logger.debug("Skip: %s", filepath)
+        return
+    document = {
+        "de": properties.get("de_name"),
+        "es": properties.get("es_name"),
+        "fr": properties.get("fr_name"),
+        "it": properties.get("it_name"),
+        "pt": properties.get("pt_name"),
+        "ja": properties.get("ja_name"),
+        "ja_romaji": properties.get("romaji"),
+        "ko": properties.get("ko_name"),
+        "ko_rr": properties.get("ko_romanized"),
+        "zh-TW": properties.get("tc_name") or properties.get("zh_name"),
+        "zh-CN": properties.get("sc_name"),
+    }
+    return properties.get("en_name"), document
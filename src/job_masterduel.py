@@ -1,26 +1,23 @@
-# SPDX-FileCopyrightText: © 2023 Kevin Lu
+# SPDX-FileCopyrightText: © 2023–2026 Kevin Lu
 # SPDX-Licence-Identifier: AGPL-3.0-or-later
 import logging
 import os
 from multiprocessing import current_process
 from typing import Any
 
-from ruamel.yaml import YAML
-
 from common import initial_parse, int_or_og
 
 module_logger = logging.getLogger(__name__)
 
 
 def job(filepath: str) -> dict[str, Any] | None:
-    yaml = YAML()
     basename = os.path.splitext(os.path.basename(filepath))[0]
     page_id = int_or_og(basename)
-    logger = module_logger.getChild(current_process().name).getChild(basename)
-    logger.info(filepath)
-    wikitext = initial_parse(yaml, filepath, "Master Duel card")
+    logger = module_logger.getChild(current_process().name)
+    logger.debug(filepath)
+    wikitext = initial_parse(filepath, "Master Duel card")
     if not wikitext:
-        logger.info("Skip")
+        logger.debug("Skip: %s", filepath)
         return
     wikitext["yugipedia_page_id"] = page_id
     return wikitext
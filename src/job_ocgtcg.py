@@ -1,56 +1,125 @@
 # SPDX-FileCopyrightText: © 2022–2026 Kevin Lu
 # SPDX-Licence-Identifier: AGPL-3.0-or-later
+import hashlib
 import json
 import logging
 import os
 import sys
+from collections import Counter
+from itertools import repeat
 from multiprocessing import current_process
 from typing import Any, NamedTuple
 
+from genson import SchemaBuilder
 from ruamel.yaml import YAML
 from ruamel.yaml.scalarstring import LiteralScalarString
 
+import profiling
 from common import (
+    CardLogger,
+    SerializedDocument,
+    WriteStats,
     annotate_shared,
+    enable_validation,
+    init_parsing,
     initial_parse,
     int_or_none,
     int_or_og,
+    language_fields,
     load_ko_csv,
     load_unreleased_csv,
+    partial_schema,
+    read_serialized,
     replace_interlinear_annotations,
+    serialized_digests,
     transform_image,
     transform_multilanguage,
     transform_names,
     transform_sets,
     write,
+    write_file,
 )
+from digest import file_digest, json_digest
+from pipeline import BackgroundWriter, prefetch
 
 module_logger = logging.getLogger(__name__)
 
 
+# Simplified Chinese texts from yaml-yugi-zh for one password
+class ZhCn(NamedTuple):
+    name: str
+    text: str
+    pendulum: str | None
+
+
+# Reads every file in the yaml-yugi-zh directory once into an index by password, instead of probing the directory for
+# each card. Optionally cached in a JSON file, reused as long as no file in the directory has been added, removed, or
+# changed, since parsing several thousand YAML files takes seconds while hashing them is nearly free.
+def load_zh_cn(directory: str, cache_file: str | None = None) -> dict[int, ZhCn]:
+    filenames = sorted(
+        filename for filename in os.listdir(directory) if filename.endswith(".yaml")
+    )
+    if cache_file:
+        fingerprint = json_digest(
+            [file_digest(__file__)]
+            + [
+                [filename, file_digest(os.path.join(directory, filename))]
+                for filename in filenames
+            ]
+        )
+        try:
+            with open(cache_file) as f:
+                cache = json.load(f)
+            if cache.get("fingerprint") == fingerprint:
+                module_logger.info(
+                    f"zh-CN: {len(cache['cards'])} cards from {cache_file}"
+                )
+                return {
+                    int(password): ZhCn(*entry)
+                    for password, entry in cache["cards"].items()
+                }
+            module_logger.info(f"zh-CN: {directory} changed since {cache_file}")
+        except FileNotFoundError:
+            module_logger.info(f"zh-CN: no cache at {cache_file}")
+    # Only plain mappings of strings, so the much faster safe loader does
+    yaml = YAML(typ="safe")
+    index = {}
+    for filename in filenames:
+        password = int_or_none(os.path.splitext(filename)[0])
+        if password is None:
+            continue
+        with open(os.path.join(directory, filename), "rb") as f:
+            zh_cn = yaml.load(f)
+        index[password] = ZhCn(zh_cn["name"], zh_cn["text"], zh_cn.get("pendulum"))
+    module_logger.info(f"zh-CN: {len(index)} cards from {directory}")
+    if cache_file:
+        module_logger.info(f"Write: {cache_file}")
+        with open(cache_file, "w", encoding="utf-8") as out:
+            json.dump(
+                {"fingerprint": fingerprint, "cards": index}, out, ensure_ascii=False
+            )
+    return index
+
+
 def annotate_zh_cn(
-    yaml: YAML, logger: logging.Logger, document: dict[str, str], zh_cn_dir: str
+    logger: logging.Logger, document: dict[str, Any], zh_cn_index: dict[int, ZhCn]
 ) -> None:
     if document["name"]["zh-CN"] and document["text"]["zh-CN"]:
         return
     password = int_or_none(document.get("password") or "")
-    zh_cn_path = os.path.join(zh_cn_dir, f"{password}.yaml")
-    if os.path.isfile(zh_cn_path):
-        logger.info(f"zh-CN: {zh_cn_path}")
-        with open(zh_cn_path) as f:
-            zh_cn = yaml.load(f)
-            if not document["name"]["zh-CN"]:
-                document["name"]["zh-CN"] = zh_cn["name"]
-            if not document["text"]["zh-CN"]:
-                document["text"]["zh-CN"] = LiteralScalarString(zh_cn["text"])
-            if (
-                document.get("pendulum_effect")
-                and not document["pendulum_effect"]["zh-CN"]
-                and zh_cn.get("pendulum")
-            ):
-                document["pendulum_effect"]["zh-CN"] = LiteralScalarString(
-                    zh_cn["pendulum"]
-                )
+    zh_cn = zh_cn_index.get(password)
+    if zh_cn:
+        logger.debug("zh-CN: %s", password)
+        if not document["name"]["zh-CN"]:
+            document["name"]["zh-CN"] = zh_cn.name
+        if not document["text"]["zh-CN"]:
+            document["text"]["zh-CN"] = LiteralScalarString(zh_cn.text)
+        if (
+            document.get("pendulum_effect")
+            and not document["pendulum_effect"]["zh-CN"]
+            and zh_cn.pendulum
+        ):
+            document["pendulum_effect"]["zh-CN"] = LiteralScalarString(zh_cn.pendulum)
 
 
 def transform_structure(
@@ -84,7 +153,7 @@ def transform_structure(
         # Rush Duel cards erroneously added to the Duel Monsters category
         "RD/" in wikitext.get("jp_sets", "")
     ):
-        logger.info(f"Skip: {wikitext}")
+        logger.debug("Skip: %s", wikitext)
         return
     konami_id = int_or_none(wikitext.get("database_id"))
     password = int_or_none(wikitext.get("password"))
@@ -154,15 +223,24 @@ def annotate_limit_regulation(
         ]
 
 
-def write_output(yaml: YAML, logger: logging.Logger, document: dict[str, Any]) -> None:
+def output_basename(document: dict[str, Any]) -> str:
     if document["password"] is not None:
         # Recreate eight-digit password with left-padded 0s
-        basename = str(document["password"]).rjust(8, "0")
+        return str(document["password"]).rjust(8, "0")
     elif document["konami_id"] is not None:
-        basename = f"kdb{document['konami_id']}"
+        return f"kdb{document['konami_id']}"
     else:
-        basename = f"yugipedia{document['yugipedia_page_id']}"
-    write(document, basename, yaml, logger)
+        return f"yugipedia{document['yugipedia_page_id']}"
+
+
+def write_output(
+    yaml: YAML,
+    logger: logging.Logger,
+    document: dict[str, Any],
+    stats: WriteStats,
+    writer: BackgroundWriter | None = None,
+) -> SerializedDocument:
+    return write(document, output_basename(document), yaml, logger, stats, writer)
 
 
 class Assignments(NamedTuple):
@@ -186,6 +264,13 @@ def load_assignments(yaml: YAML, file: str) -> Assignments:
     return assignments
 
 
+def first_release(document: dict[str, Any]) -> dict[str, Any] | None:
+    if len(document["sets"].get("ja", [])):
+        return document["sets"]["ja"][0]
+    elif len(document["sets"].get("en", [])):
+        return document["sets"]["en"][0]
+
+
 def annotate_assignments(document: dict[str, Any], assignments: Assignments) -> None:
     # Direct assignment, may be used for certain passwordless cards or individual prereleases
     page_id = document["yugipedia_page_id"]
@@ -195,11 +280,8 @@ def annotate_assignments(document: dict[str, Any], assignments: Assignments) ->
 
     # Prerelease password assignment by set
     if document["password"] is None:
-        if len(document["sets"].get("ja", [])):
-            release = document["sets"]["ja"][0]
-        elif len(document["sets"].get("en", [])):
-            release = document["sets"]["en"][0]
-        else:
+        release = first_release(document)
+        if not release:
             return
         # https://yugipedia.com/wiki/Card_Number
         # one-character region codes and two-digit position numbers are no longer a thing
@@ -235,13 +317,26 @@ def mixin_text(
     if not document[pkey][ckey]:
         source = master_duel_card.get(skey)
         if source and source != ".":
-            logger.info(f"Merging in Master Duel {pkey}.{ckey}")
+            logger.debug("Merging in Master Duel %s.%s", pkey, ckey)
             if pkey == "text" or pkey == "pendulum_effect":
                 document[pkey][ckey] = LiteralScalarString(source)
             else:
                 document[pkey][ckey] = source
 
 
+# (document field, language, Master Duel key) for every translation that Master Duel data can fill in
+MASTER_DUEL_MIXINS = tuple(
+    (pkey, language, key)
+    for pkey, base in (
+        ("name", "name"),
+        ("text", "lore"),
+        ("pendulum_effect", "pendulum_effect"),
+    )
+    for language, key in language_fields(base)
+    if language != "en"
+)
+
+
 def annotate_master_duel(
     logger: logging.Logger,
     document: dict[str, Any],
@@ -252,99 +347,11 @@ def annotate_master_duel(
     master_duel_card = master_duel.get(name, master_duel.get(title))
     # Skip Normal Monster version of Black Luster Soldier since will match the Ritual Monster
     if master_duel_card and document["konami_id"] != 19092:
-        logger.info(f"Annotating [{name}] with Master Duel data")
+        logger.debug("Annotating [%s] with Master Duel data", name)
         document["master_duel_rarity"] = master_duel_card["rarity"]
-        mixin_text("name", "de", "de_name", document, master_duel_card, logger)
-        mixin_text("name", "es", "es_name", document, master_duel_card, logger)
-        mixin_text("name", "fr", "fr_name", document, master_duel_card, logger)
-        mixin_text("name", "it", "it_name", document, master_duel_card, logger)
-        mixin_text("name", "pt", "pt_name", document, master_duel_card, logger)
-        mixin_text("name", "ja", "ja_name", document, master_duel_card, logger)
-        mixin_text("name", "ko", "ko_name", document, master_duel_card, logger)
-        mixin_text("name", "zh-TW", "tc_name", document, master_duel_card, logger)
-        mixin_text("name", "zh-CN", "sc_name", document, master_duel_card, logger)
-        mixin_text("text", "de", "de_lore", document, master_duel_card, logger)
-        mixin_text("text", "es", "es_lore", document, master_duel_card, logger)
-        mixin_text("text", "fr", "fr_lore", document, master_duel_card, logger)
-        mixin_text("text", "it", "it_lore", document, master_duel_card, logger)
-        mixin_text("text", "pt", "pt_lore", document, master_duel_card, logger)
-        mixin_text("text", "ja", "ja_lore", document, master_duel_card, logger)
-        mixin_text("text", "ko", "ko_lore", document, master_duel_card, logger)
-        mixin_text("text", "zh-TW", "tc_lore", document, master_duel_card, logger)
-        mixin_text("text", "zh-CN", "sc_lore", document, master_duel_card, logger)
-        if document.get("pendulum_effect"):
-            mixin_text(
-                "pendulum_effect",
-                "de",
-                "de_pendulum_effect",
-                document,
-                master_duel_card,
-                logger,
-            )
-            mixin_text(
-                "pendulum_effect",
-                "es",
-                "es_pendulum_effect",
-                document,
-                master_duel_card,
-                logger,
-            )
-            mixin_text(
-                "pendulum_effect",
-                "fr",
-                "fr_pendulum_effect",
-                document,
-                master_duel_card,
-                logger,
-            )
-            mixin_text(
-                "pendulum_effect",
-                "it",
-                "it_pendulum_effect",
-                document,
-                master_duel_card,
-                logger,
-            )
-            mixin_text(
-                "pendulum_effect",
-                "pt",
-                "pt_pendulum_effect",
-                document,
-                master_duel_card,
-                logger,
-            )
-            mixin_text(
-                "pendulum_effect",
-                "ja",
-                "ja_pendulum_effect",
-                document,
-                master_duel_card,
-                logger,
-            )
-            mixin_text(
-                "pendulum_effect",
-                "ko",
-                "ko_pendulum_effect",
-                document,
-                master_duel_card,
-                logger,
-            )
-            mixin_text(
-                "pendulum_effect",
-                "zh-TW",
-                "tc_pendulum_effect",
-                document,
-                master_duel_card,
-                logger,
-            )
-            mixin_text(
-                "pendulum_effect",
-                "zh-CN",
-                "sc_pendulum_effect",
-                document,
-                master_duel_card,
-                logger,
-            )
+        for pkey, ckey, skey in MASTER_DUEL_MIXINS:
+            if pkey != "pendulum_effect" or document.get("pendulum_effect"):
+                mixin_text(pkey, ckey, skey, document, master_duel_card, logger)
 
 
 def replace_text(
@@ -358,8 +365,12 @@ def replace_text(
     # CSV only has empty strings, but null is preferred for YAML and JSON
     source = official_card[skey] or None
     if document[pkey][ckey] != source:
-        logger.info(
-            f"{pkey}.{ckey} does not match: O[{source}] Y[{document[pkey][ckey]}]"
+        logger.debug(
+            "%s.%s does not match: O[%s] Y[%s]",
+            pkey,
+            ckey,
+            source,
+            document[pkey][ckey],
         )
         if pkey == "text" or pkey == "pendulum_effect":
             document[pkey][ckey] = LiteralScalarString(source)
@@ -375,7 +386,7 @@ def replace_with_official(
 ) -> None:
     kid = document["konami_id"]
     if kid and official.get(kid):
-        logger.info(f"{kid}: replacing {lang} text with official database")
+        logger.debug("Replacing %s text with official database", lang)
         replace_text("name", lang, "name", document, official[kid], logger)
         replace_text("text", lang, "text", document, official[kid], logger)
         if document.get("pendulum_effect"):
@@ -391,44 +402,55 @@ def override_ko(
 ) -> None:
     kid = document["konami_id"]
     if kid and ko_override.get(kid):
-        module_logger.info(f"APPLYING OVERRIDE FOR {kid}")
+        logger.debug("Applying override for %s", kid)
         if ko_override[kid]["name"]:
-            logger.info(f"{kid}: overriding name.ko")
+            logger.debug("Overriding name.ko")
             document["name"]["ko"] = replace_interlinear_annotations(
                 ko_override[kid]["name"]
             )
         if ko_override[kid]["text"]:
-            logger.info(f"{kid}: overriding text.ko")
+            logger.debug("Overriding text.ko")
             document["text"]["ko"] = LiteralScalarString(ko_override[kid]["text"])
         if ko_override[kid]["pendulum"]:
-            logger.info(f"{kid}: overriding pendulum_effect.ko")
+            logger.debug("Overriding pendulum_effect.ko")
             document["pendulum_effect"]["ko"] = LiteralScalarString(
                 ko_override[kid]["pendulum"]
             )
 
 
-def job(
-    wikitext_dir: str,
-    filenames: list[str],
+# Lookup tables shared by every card, built once in the parent process by load_side_inputs
+class SideInputs(NamedTuple):
+    zh_cn: dict[int, ZhCn] | None
+    assignments: Assignments | None
+    tcg_vector: dict[str, int] | None
+    ocg_vector: dict[str, int] | None
+    unreleased: dict[str, dict[str, str]]
+    ko_official: dict[int, dict[str, str]] | None
+    ko_override: dict[int, dict[str, str]] | None
+    master_duel: dict[str, Any] | None
+
+
+def load_side_inputs(
     zh_cn_dir: str | None = None,
+    zh_cn_cache: str | None = None,
     assignment_file: str | None = None,
-    tcg_vector: dict[str, int] | None = None,
-    ocg_vector: dict[str, int] | None = None,
+    tcg_vector_json: str | None = None,
+    ocg_vector_json: str | None = None,
     unreleased_csv: str | None = None,
     ko_official_csv: str | None = None,
     ko_override_csv: str | None = None,
-    ko_prerelease_csv: str | None = None,
     master_duel_raw_json: str | None = None,
-    return_results=False,
-) -> list[dict[str, Any]] | None:
+) -> SideInputs:
     yaml = YAML()
-    yaml.width = sys.maxsize
     assignments = load_assignments(yaml, assignment_file) if assignment_file else None
-    unreleased = load_unreleased_csv(unreleased_csv)
-    ko_official = load_ko_csv("konami_id", ko_official_csv)
-    ko_override = load_ko_csv("konami_id", ko_override_csv)
-    ko_prerelease = load_ko_csv("yugipedia_page_id", ko_prerelease_csv)  # noqa: F841
-    job_logger = module_logger.getChild(current_process().name)
+    tcg_vector = None
+    ocg_vector = None
+    if tcg_vector_json:
+        with open(tcg_vector_json) as f:
+            tcg_vector = json.load(f)["regulation"]
+    if ocg_vector_json:
+        with open(ocg_vector_json) as f:
+            ocg_vector = json.load(f)["regulation"]
     if master_duel_raw_json:
         with open(master_duel_raw_json) as f:
             raw = json.load(f)
@@ -437,40 +459,231 @@ def job(
                 key = card["en_name"]
                 # Edge cases where the Master Duel name differs for some reason (as of writing, Maliss and Reactor)
                 if "main" in card and not card["main"].endswith(" (card)"):
-                    job_logger.info(f"[{key} (Master Duel)] is [{card['main']}]")
+                    module_logger.info(f"[{key} (Master Duel)] is [{card['main']}]")
                     key = card["main"]
                 master_duel[key] = card
     else:
         master_duel = None
-    results = []
-    for i, filename in enumerate(filenames):
-        filepath = os.path.join(wikitext_dir, filename)
+    return SideInputs(
+        load_zh_cn(zh_cn_dir, zh_cn_cache) if zh_cn_dir else None,
+        assignments,
+        tcg_vector,
+        ocg_vector,
+        load_unreleased_csv(unreleased_csv),
+        load_ko_csv("konami_id", ko_official_csv),
+        load_ko_csv("konami_id", ko_override_csv),
+        master_duel,
+    )
+
+
+# Set once in each worker by init_worker instead of being sent along with every chunk of files. With the default fork
+# start method on Linux, workers share the parent's copy of the side inputs instead of each parsing their own.
+side_inputs = SideInputs(None, None, None, None, {}, None, None, None)
+# Entries from the manifest of the previous run, or None if not running incrementally
+previous_manifest: dict[str, dict[str, Any]] | None = None
+
+
+def init_worker(
+    side: SideInputs,
+    manifest: dict[str, dict[str, Any]] | None = None,
+    profile: bool = False,
+    profile_dir: str | None = None,
+    schema: dict[str, Any] | None = None,
+    parse_cache_file: str | None = None,
+    fast_extraction: bool = False,
+) -> None:
+    global side_inputs, previous_manifest
+    side_inputs = side
+    previous_manifest = manifest
+    if profile:
+        profiling.enable(profile_dir)
+    enable_validation(schema)
+    init_parsing(parse_cache_file, fast_extraction)
+
+
+# Everything about a card, besides its page, that determines which rows of the side inputs apply to it
+def manifest_keys(document: dict[str, Any], title: str) -> dict[str, Any]:
+    release = first_release(document)
+    return {
+        "konami_id": document["konami_id"],
+        "password": document["password"],
+        "name": document["name"]["en"],
+        "title": title,
+        "yugipedia_page_id": document["yugipedia_page_id"],
+        "set_abbreviation": release["set_number"].split("-")[0] if release else None,
+    }
+
+
+def side_input_digest(keys: dict[str, Any], side: SideInputs) -> str:
+    (
+        zh_cn,
+        assignments,
+        tcg_vector,
+        ocg_vector,
+        unreleased,
+        ko_official,
+        ko_override,
+        master_duel,
+    ) = side
+    kid = keys["konami_id"]
+    return json_digest(
+        [
+            assignments and assignments.yugipedia.get(keys["yugipedia_page_id"]),
+            assignments and assignments.set_abbreviation.get(keys["set_abbreviation"]),
+            tcg_vector and tcg_vector.get(str(kid)),
+            ocg_vector and ocg_vector.get(str(kid)),
+            unreleased.get(keys["name"]),
+            ko_official and ko_official.get(kid),
+            ko_override and ko_override.get(kid),
+            master_duel
+            and master_duel.get(keys["name"], master_duel.get(keys["title"])),
+            zh_cn and zh_cn.get(int_or_none(keys["password"] or "")),
+        ]
+    )
+
+
+def job(
+    wikitext_dir: str,
+    filenames: list[str],
+    return_serialized=False,
+    generate_schema=False,
+    pipeline=False,
+) -> tuple[
+    list[SerializedDocument] | None,
+    dict[str, dict[str, Any]],
+    WriteStats,
+    dict[str, Any] | None,
+    profiling.Timings | None,
+]:
+    yaml = YAML()
+    yaml.width = sys.maxsize
+    (
+        zh_cn,
+        assignments,
+        tcg_vector,
+        ocg_vector,
+        unreleased,
+        ko_official,
+        ko_override,
+        master_duel,
+    ) = side_inputs
+    job_logger = module_logger.getChild(current_process().name)
+    serialized = []
+    manifest = {}
+    stats = WriteStats(set(), Counter(), {})
+    # Builders cannot be pickled, so only the partial schema is returned for the parent to merge
+    builder = SchemaBuilder() if generate_schema else None
+    filepaths = [os.path.join(wikitext_dir, filename) for filename in filenames]
+    # With pipeline, pages are read ahead and outputs written behind in background threads
+    contents = prefetch(filepaths) if pipeline else repeat(None)
+    writer = BackgroundWriter(write_file) if pipeline else None
+    for i, (filename, filepath, content) in enumerate(
+        zip(filenames, filepaths, contents)
+    ):
         # This should always be int, but code defensively and allow future changes to yaml-yugipedia's structure
         basename = os.path.splitext(filename)[0]
         page_id = int_or_og(basename)
-        logger = job_logger.getChild(basename)
-        logger.info(f"{i}/{len(filenames)} {filepath}")
-
-        properties = initial_parse(yaml, filepath)
+        logger = CardLogger(job_logger, {"card": basename})
+        logger.debug("%d/%d %s", i, len(filenames), filepath)
+
+        if previous_manifest is not None:
+            with profiling.stage("manifest digest"):
+                digest = (
+                    file_digest(filepath)
+                    if content is None
+                    else hashlib.sha256(content).hexdigest()
+                )
+            previous = previous_manifest.get(filename)
+            if previous and previous["sha256"] == digest:
+                output = previous["basename"]
+                if output is None:
+                    logger.debug("Unchanged, skip: %s", filepath)
+                    manifest[filename] = previous
+                    continue
+                if previous["side"] == side_input_digest(previous["keys"], side_inputs):
+                    # The outputs are read back anyway to check they were not changed or deleted since
+                    with profiling.stage("read unchanged"):
+                        document_serialized = read_serialized(
+                            output,
+                            previous.get("outputs"),
+                            return_serialized or builder is not None,
+                        )
+                else:
+                    document_serialized = None
+                if document_serialized:
+                    logger.debug("Unchanged, reuse: %s", output)
+                    manifest[filename] = previous
+                    stats.basenames.add(output)
+                    stats.counts["unchanged"] += 2
+                    # Still invalid, since neither the document nor the schema changed
+                    if "failure" in previous:
+                        stats.failures[output] = previous["failure"]
+                    if return_serialized or builder is not None:
+                        if return_serialized:
+                            serialized.append(document_serialized)
+                        if builder is not None:
+                            with profiling.stage("generate schema"):
+                                builder.add_object(json.loads(document_serialized.json))
+                    continue
+
+        properties = initial_parse(filepath, content=content)
         if not properties:
-            logger.info(f"Skip: {filepath}")
+            logger.debug("Skip: %s", filepath)
+            if previous_manifest is not None:
+                manifest[filename] = {"sha256": digest, "basename": None}
             continue
         properties["yugipedia_page_id"] = page_id
-        document = transform_structure(logger, properties)
+        with profiling.stage("transform_structure"):
+            document = transform_structure(logger, properties)
+        if previous_manifest is not None:
+            if document:
+                keys = manifest_keys(document, properties["title"])
+                manifest[filename] = {
+                    "sha256": digest,
+                    "basename": output_basename(document),
+                    "keys": keys,
+                    "side": side_input_digest(keys, side_inputs),
+                }
+            else:
+                manifest[filename] = {"sha256": digest, "basename": None}
         if document:
-            annotate_limit_regulation(document, unreleased, tcg_vector, ocg_vector)
+            with profiling.stage("annotate limit regulation"):
+                annotate_limit_regulation(document, unreleased, tcg_vector, ocg_vector)
             if ko_official:
-                replace_with_official(logger, document, ko_official, "ko")
+                with profiling.stage("annotate ko official"):
+                    replace_with_official(logger, document, ko_official, "ko")
             if master_duel:
-                annotate_master_duel(logger, document, master_duel, properties["title"])
+                with profiling.stage("annotate Master Duel"):
+                    annotate_master_duel(
+                        logger, document, master_duel, properties["title"]
+                    )
             if assignments:
-                annotate_assignments(document, assignments)
+                with profiling.stage("annotate assignments"):
+                    annotate_assignments(document, assignments)
             if ko_override:
-                override_ko(logger, document, ko_override)
-            if zh_cn_dir:
-                annotate_zh_cn(yaml, logger, document, zh_cn_dir)
-            write_output(yaml, logger, document)
-            if return_results:
-                results.append(document)
-    if return_results:
-        return results
+                with profiling.stage("annotate ko override"):
+                    override_ko(logger, document, ko_override)
+            if zh_cn:
+                with profiling.stage("annotate zh-CN"):
+                    annotate_zh_cn(logger, document, zh_cn)
+            document_serialized = write_output(yaml, logger, document, stats, writer)
+            if previous_manifest is not None:
+                manifest[filename]["outputs"] = serialized_digests(document_serialized)
+                if document_serialized.basename in stats.failures:
+                    manifest[filename]["failure"] = stats.failures[
+                        document_serialized.basename
+                    ]
+            if return_serialized:
+                serialized.append(document_serialized)
+            if builder is not None:
+                with profiling.stage("generate schema"):
+                    builder.add_object(document)
+    if writer:
+        stats.counts.update(writer.close())
+    return (
+        serialized if return_serialized else None,
+        manifest,
+        stats,
+        partial_schema(builder) if builder is not None else None,
+        profiling.collect(),
+    )
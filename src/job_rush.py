@@ -4,17 +4,25 @@ import json
 import logging
 import os
 import sys
+from collections import Counter
 from multiprocessing import current_process
-from typing import Any
+from typing import Any, NamedTuple
 
+from genson import SchemaBuilder
 from ruamel.yaml import YAML
 
 from common import (
+    CardLogger,
+    SerializedDocument,
+    WriteStats,
     annotate_shared,
+    enable_validation,
+    init_parsing,
     initial_parse,
     int_or_none,
     int_or_og,
     load_ko_csv,
+    partial_schema,
     replace_interlinear_annotations,
     str_or_none,
     transform_image,
@@ -33,7 +41,7 @@ def transform_structure(
     if wikitext.get("card_type") == "Duel Marker" or wikitext.get(
         "This card cannot be in a Deck."
     ):
-        logger.info(f"Skip: {wikitext}")
+        logger.debug("Skip: %s", wikitext)
         return
     konami_id = int_or_none(wikitext.get("database_id"))
     document = {"konami_id": konami_id, "name": transform_names(wikitext)}
@@ -101,15 +109,13 @@ def merge_ko(
         ko_prerelease.get(document["yugipedia_page_id"]) if ko_prerelease else None
     )
     if override:
-        sublogger = logger.getChild("override")
-        sublogger.info(f"[{document['name']['ko']}] -> [{override['name']}]")
+        logger.debug("override: [%s] -> [%s]", document["name"]["ko"], override["name"])
         overwrite(logger, document, override)
     if prerelease:
-        sublogger = logger.getChild("prerelease")
         if document["name"]["ko"]:
-            sublogger.warning(f"Extraneous row [{document['name']['ko']}]")
+            logger.warning(f"prerelease: Extraneous row [{document['name']['ko']}]")
         else:
-            sublogger.info(f"Injecting [{prerelease['name']}]")
+            logger.debug("prerelease: Injecting [%s]", prerelease["name"])
             overwrite(logger, document, prerelease)
             flags = document.setdefault("is_translation_unofficial", {})
             flags.setdefault("name", {})["ko"] = True
@@ -118,53 +124,91 @@ def merge_ko(
 
 # On Yugipedia, Rush Duel cards inherit their Japanese name from their OCG counterpart
 def annotate_ocg_ja_name(
-    logger: logging.Logger, document: dict[str, Any], ocg_cards: dict[str, Any]
+    logger: logging.Logger,
+    document: dict[str, Any],
+    ocg_ja_names: dict[str, str | None],
 ) -> None:
     name = document["name"]["en"]
-    ocg_card = ocg_cards.get(name)
-    if ocg_card and not document["name"]["ja"]:
-        logger.info(f"Annotating [{name}] with Japanese OCG card name")
-        document["name"]["ja"] = ocg_card["name"]["ja"]
+    if name in ocg_ja_names and not document["name"]["ja"]:
+        logger.debug("Annotating [%s] with Japanese OCG card name", name)
+        document["name"]["ja"] = ocg_ja_names[name]
 
 
-def write_output(yaml: YAML, logger: logging.Logger, document: dict[str, Any]) -> None:
+def write_output(
+    yaml: YAML, logger: logging.Logger, document: dict[str, Any], stats: WriteStats
+) -> SerializedDocument:
     if document["konami_id"] is not None:
         basename = document["konami_id"]
     else:
         basename = f"yugipedia{document['yugipedia_page_id']}"
-    write(document, basename, yaml, logger)
+    return write(document, basename, yaml, logger, stats)
 
 
-def job(
-    wikitext_dir: str,
-    filenames: list[str],
-    ko_official_csv: str | None = None,
+# Lookup tables shared by every card, built once in the parent process by load_side_inputs
+class SideInputs(NamedTuple):
+    ko_override: dict[int, dict[str, str]] | None
+    ko_prerelease: dict[int, dict[str, str]] | None
+    # Only the Japanese names are needed from the OCG aggregate, so the rest of each card is dropped
+    ocg_ja_names: dict[str, str | None] | None
+
+
+def load_side_inputs(
     ko_override_csv: str | None = None,
     ko_prerelease_csv: str | None = None,
     ocg_aggregate: str | None = None,
-    return_results=False,
-) -> list[dict[str, Any]] | None:
-    yaml = YAML()
-    yaml.width = sys.maxsize
-    ko_official = load_ko_csv("konami_id", ko_official_csv)  # noqa: F841
-    ko_override = load_ko_csv("konami_id", ko_override_csv)
-    ko_prerelease = load_ko_csv("yugipedia_page_id", ko_prerelease_csv)
+) -> SideInputs:
     if ocg_aggregate:
         with open(ocg_aggregate) as f:
             raw = json.load(f)
-            ocg_cards = {card["name"]["en"]: card for card in raw}
+            ocg_ja_names = {card["name"]["en"]: card["name"]["ja"] for card in raw}
     else:
-        ocg_cards = None
-    results = []
+        ocg_ja_names = None
+    return SideInputs(
+        load_ko_csv("konami_id", ko_override_csv),
+        load_ko_csv("yugipedia_page_id", ko_prerelease_csv),
+        ocg_ja_names,
+    )
+
+
+# Set once in each worker by init_worker instead of being sent along with every chunk of files
+side_inputs = SideInputs(None, None, None)
+
+
+def init_worker(
+    side: SideInputs,
+    schema: dict[str, Any] | None = None,
+    parse_cache_file: str | None = None,
+    fast_extraction: bool = False,
+) -> None:
+    global side_inputs
+    side_inputs = side
+    enable_validation(schema)
+    init_parsing(parse_cache_file, fast_extraction)
+
+
+def job(
+    wikitext_dir: str,
+    filenames: list[str],
+    return_serialized=False,
+    generate_schema=False,
+) -> tuple[list[SerializedDocument] | None, WriteStats, dict[str, Any] | None]:
+    yaml = YAML()
+    yaml.width = sys.maxsize
+    ko_override, ko_prerelease, ocg_ja_names = side_inputs
+    job_logger = module_logger.getChild(current_process().name)
+    serialized = []
+    stats = WriteStats(set(), Counter(), {})
+    # Builders cannot be pickled, so only the partial schema is returned for the parent to merge
+    builder = SchemaBuilder() if generate_schema else None
     for i, filename in enumerate(filenames):
         filepath = os.path.join(wikitext_dir, filename)
         # This should always be int, but code defensively and allow future changes to yaml-yugipedia's structure
         basename = os.path.splitext(filename)[0]
         page_id = int_or_og(basename)
-        logger = module_logger.getChild(current_process().name).getChild(basename)
-        logger.info(f"{i}/{len(filenames)} {filepath}")
+        logger = CardLogger(job_logger, {"card": basename})
+        logger.debug("%d/%d %s", i, len(filenames), filepath)
 
-        properties = initial_parse(yaml, filepath)
+        properties = initial_parse(filepath)
         if not properties or (
             # Details unavailable for a new leak
             properties.get("level") == "???"
@@ -177,17 +221,22 @@ def job(
             # Not legal for play https://ygorganization.com/realspeedduel/
             properties.get("card_type") == "Skill"
         ):
-            logger.info(f"Skip: {filepath}")
+            logger.debug("Skip: %s", filepath)
             continue
         properties["yugipedia_page_id"] = page_id
         document = transform_structure(logger, properties)
         if not document:
             continue
         merge_ko(logger, document, ko_override, ko_prerelease)
-        if ocg_cards:
-            annotate_ocg_ja_name(logger, document, ocg_cards)
-        write_output(yaml, logger, document)
-        if return_results:
-            results.append(document)
-    if return_results:
-        return results
+        if ocg_ja_names:
+            annotate_ocg_ja_name(logger, document, ocg_ja_names)
+        document_serialized = write_output(yaml, logger, document, stats)
+        if return_serialized:
+            serialized.append(document_serialized)
+        if builder is not None:
+            builder.add_object(document)
+    return (
+        serialized if return_serialized else None,
+        stats,
+        partial_schema(builder) if builder is not None else None,
+    )
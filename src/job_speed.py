@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: © 2022–2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+import logging
+import os
+import sys
+from collections import Counter
+from multiprocessing import current_process
+from typing import Any
+
+from genson import SchemaBuilder
+from ruamel.yaml import YAML
+
+from common import (
+    SerializedDocument,
+    WriteStats,
+    enable_validation,
+    init_parsing,
+    initial_parse,
+    int_or_og,
+    partial_schema,
+    transform_multilanguage,
+    transform_names,
+    transform_sets,
+    write,
+)
+
+module_logger = logging.getLogger(__name__)
+
+
+def transform_structure(wikitext: dict[str, str]) -> dict[str, Any] | None:
+    return {
+        "name": transform_names(wikitext),
+        "type_line": wikitext["types"],
+        "activation": transform_multilanguage(wikitext, "skill_activation"),
+        "effect": transform_multilanguage(wikitext, "text"),
+        "character": wikitext.get("character"),  # bonus field
+        "image_front": wikitext.get("image"),
+        "image_back": wikitext.get("image2"),
+        "sets": transform_sets(wikitext),
+        "yugipedia_page_id": wikitext.get("yugipedia_page_id"),
+    }
+
+
+def init_worker(
+    schema: dict[str, Any] | None = None,
+    parse_cache_file: str | None = None,
+    fast_extraction: bool = False,
+) -> None:
+    enable_validation(schema)
+    init_parsing(parse_cache_file, fast_extraction)
+
+
+def job(
+    wikitext_dir: str,
+    filenames: list[str],
+    return_serialized=False,
+    generate_schema=False,
+) -> tuple[list[SerializedDocument] | None, WriteStats, dict[str, Any] | None]:
+    yaml = YAML()
+    yaml.width = sys.maxsize
+    logger = module_logger.getChild(current_process().name)
+    serialized = []
+    stats = WriteStats(set(), Counter(), {})
+    builder = SchemaBuilder() if generate_schema else None
+    for filename in filenames:
+        filepath = os.path.join(wikitext_dir, filename)
+        logger.debug(filepath)
+        basename = os.path.splitext(filename)[0]
+        page_id = int_or_og(basename)
+        properties = initial_parse(filepath)
+        if not properties:
+            logger.debug("Skip: %s", filepath)
+            continue
+        properties["yugipedia_page_id"] = page_id
+        skill = transform_structure(properties)
+        skill_serialized = write(skill, f"yugipedia{page_id}", yaml, logger, stats)
+        if return_serialized:
+            serialized.append(skill_serialized)
+        if builder is not None:
+            builder.add_object(skill)
+    return (
+        serialized if return_serialized else None,
+        stats,
+        partial_schema(builder) if builder is not None else None,
+    )
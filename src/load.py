@@ -0,0 +1,332 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+#
+# Loads an NDJSON aggregate into an OpenSearch index with the bulk API. Cards are streamed from the aggregate, and with
+# --state, only cards whose content changed since the last successful load are sent. Bulk requests run a few at a time,
+# and when OpenSearch rejects requests or individual cards with 429 Too Many Requests, every request slows down
+# together and recovers once requests succeed again, rather than always sleeping between batches.
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from collections import Counter, deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit, urlunsplit
+from urllib.request import Request, urlopen
+
+from common import expand_ruby
+from digest import json_digest
+
+parser = ArgumentParser(
+    description="Load an NDJSON aggregate into an OpenSearch index, sending only changed cards"
+)
+parser.add_argument("aggregate", help="NDJSON aggregate, e.g. cards.ndjson")
+parser.add_argument("index", help="OpenSearch index")
+parser.add_argument(
+    "--url",
+    default=os.environ.get("OPENSEARCH_URL"),
+    help="OpenSearch URL, optionally with credentials, default $OPENSEARCH_URL",
+)
+parser.add_argument(
+    "--state",
+    help="JSON file of the content hash of every card last loaded; unchanged cards are not sent again",
+)
+parser.add_argument(
+    "--batch-size", type=int, default=500, help="cards per bulk request"
+)
+parser.add_argument(
+    "--concurrency", type=int, default=2, help="bulk requests in flight at once"
+)
+parser.add_argument(
+    "--retries",
+    type=int,
+    default=8,
+    help="attempts for each batch of cards before giving up on it, whether the whole request or some cards were rejected",
+)
+
+logger = logging.getLogger(__name__)
+
+# Status codes for which a request is retried after backing off
+RETRY_STATUS = {429, 502, 503, 504}
+# Seconds to wait before every request after the first 429, and at most
+INITIAL_DELAY = 1
+MAXIMUM_DELAY = 60
+TIMEOUT = 120
+
+
+# Delay before each request shared by every thread: doubled on every throttled or failed request and halved on every
+# success, so that the request rate settles at what the cluster accepts
+class Backoff:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.delay = 0.0
+
+    def wait(self) -> None:
+        if self.delay:
+            # Jitter so that threads throttled together do not retry in lockstep
+            time.sleep(self.delay * random.uniform(0.5, 1))
+
+    def throttled(self, retry_after: float | None = None) -> None:
+        with self.lock:
+            self.delay = min(MAXIMUM_DELAY, max(INITIAL_DELAY, self.delay * 2))
+            if retry_after:
+                self.delay = max(self.delay, retry_after)
+            logger.warning(f"Throttled, delaying requests by {self.delay:.1f} s")
+
+    def succeeded(self) -> None:
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > INITIAL_DELAY else 0.0
+
+
+class OpenSearch:
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        # urllib does not send credentials in the URL by itself
+        self.headers = {}
+        if parts.username is not None:
+            credentials = f"{parts.username}:{parts.password or ''}"
+            self.headers["Authorization"] = (
+                f"Basic {base64.b64encode(credentials.encode()).decode()}"
+            )
+        netloc = parts.hostname + (f":{parts.port}" if parts.port else "")
+        self.url = urlunsplit((parts.scheme, netloc, parts.path.rstrip("/"), "", ""))
+        self.backoff = Backoff()
+
+    def request(
+        self, method: str, path: str, body: bytes, content_type: str, retries: int
+    ) -> dict[str, Any]:
+        for attempt in range(retries):
+            result = self.attempt(
+                method, path, body, content_type, attempt == retries - 1
+            )
+            if result is not None:
+                return result
+        raise ValueError(f"retries must be at least 1, not {retries}")
+
+    # Sends the request once. Returns None if it should be retried after backing off, unless this is the last attempt,
+    # which raises instead.
+    def attempt(
+        self, method: str, path: str, body: bytes, content_type: str, last: bool
+    ) -> dict[str, Any] | None:
+        self.backoff.wait()
+        request = Request(
+            f"{self.url}{path}",
+            body,
+            {**self.headers, "Content-Type": content_type},
+            method=method,
+        )
+        try:
+            with urlopen(request, timeout=TIMEOUT) as response:
+                result = json.load(response)
+            self.backoff.succeeded()
+            return result
+        except HTTPError as e:
+            if e.code not in RETRY_STATUS or last:
+                raise
+            logger.warning(f"{method} {path}: {e.code}, retrying")
+            retry_after = e.headers.get("Retry-After")
+            self.backoff.throttled(
+                float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        except (URLError, TimeoutError) as e:
+            if last:
+                raise
+            logger.warning(f"{method} {path}: {e}, retrying")
+            self.backoff.throttled()
+        return None
+
+    # Indexes the cards and returns the IDs of those that succeeded. Cards rejected with 429 are sent again. Retrying
+    # the whole request and sending rejected cards again share the same retries, so there are at most that many
+    # requests per batch.
+    def bulk(
+        self, index: str, cards: list[tuple[str, bytes]], retries: int
+    ) -> list[str]:
+        indexed = []
+        for attempt in range(retries):
+            last = attempt == retries - 1
+            body = b"".join(
+                b'{"index":{"_id":' + json.dumps(card_id).encode() + b"}}\n" + card
+                for card_id, card in cards
+            )
+            response = self.attempt(
+                "POST", f"/{index}/_bulk", body, "application/x-ndjson", last
+            )
+            if response is None:
+                continue
+            rejected = []
+            for (card_id, card), item in zip(cards, response["items"]):
+                status = item["index"]["status"]
+                if status < 300:
+                    indexed.append(card_id)
+                elif status == 429 and not last:
+                    rejected.append((card_id, card))
+                else:
+                    logger.error(f"{card_id}: {item['index'].get('error')}")
+            if not rejected:
+                break
+            logger.warning(f"{len(rejected)} card(s) rejected with 429, retrying")
+            self.backoff.throttled()
+            cards = rejected
+        return indexed
+
+
+# Same as parseAndExpandRuby in load.ts, for searching by either the base text or the ruby
+def add_expanded_name(card: dict[str, Any]) -> None:
+    expanded_name = {}
+    for language in ("ja", "ko"):
+        name = card["name"].get(language)
+        expanded_name[language] = (
+            expand_ruby(name) if name and "<ruby>" in name else name
+        )
+    card["expanded_name"] = expanded_name
+
+
+# The hashes cover everything sent for each card, so only a different target invalidates them
+def loader_fingerprint(url: str, index: str) -> str:
+    return json_digest({"url": url, "index": index})
+
+
+def load_state(filename: str, fingerprint: str) -> dict[str, str]:
+    try:
+        with open(filename) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        logger.info(f"No state at {filename}, loading everything")
+        return {}
+    if state.get("fingerprint") != fingerprint:
+        logger.info("Different OpenSearch or index from the state, loading everything")
+        return {}
+    return state["cards"]
+
+
+def save_state(filename: str, fingerprint: str, state: dict[str, str]) -> None:
+    logger.info(f"Write: {filename}")
+    with open(filename, "w", encoding="utf-8") as out:
+        json.dump({"fingerprint": fingerprint, "cards": state}, out)
+
+
+# Yields (ID, content hash, serialized card) for every card in the aggregate
+def read_cards(filename: str) -> Iterator[tuple[str, str, bytes]]:
+    with open(filename, "rb") as f:
+        for line in f:
+            if line.isspace():
+                continue
+            card = json.loads(line)
+            add_expanded_name(card)
+            serialized = json.dumps(card, ensure_ascii=False).encode("utf-8") + b"\n"
+            yield (
+                str(card["yugipedia_page_id"]),
+                hashlib.sha256(serialized).hexdigest(),
+                serialized,
+            )
+
+
+def load(
+    opensearch: OpenSearch,
+    filename: str,
+    index: str,
+    previous: dict[str, str],
+    state: dict[str, str],
+    batch_size: int,
+    concurrency: int,
+    retries: int,
+) -> Counter[str]:
+    # state is filled in as cards are found unchanged or indexed, so that the progress can be saved even if a request
+    # fails partway through
+    # Allow ? ATK/DEF to be stored
+    mapping = {
+        "properties": {
+            "atk": {"type": "long", "ignore_malformed": True},
+            "def": {"type": "long", "ignore_malformed": True},
+        }
+    }
+    opensearch.request(
+        "PUT",
+        f"/{index}/_mapping",
+        json.dumps(mapping).encode(),
+        "application/json",
+        retries,
+    )
+    digests = {}
+    counts: Counter[str] = Counter()
+    with ThreadPoolExecutor(concurrency, "bulk") as executor:
+        pending: deque[Future[list[str]]] = deque()
+
+        def collect(future: Future[list[str]]) -> None:
+            indexed = future.result()
+            for card_id in indexed:
+                state[card_id] = digests.pop(card_id)
+            counts["indexed"] += len(indexed)
+            logger.info(f"Indexed: {counts['indexed']}")
+
+        batch = []
+        for card_id, digest, card in read_cards(filename):
+            if previous.get(card_id) == digest:
+                state[card_id] = digest
+                counts["unchanged"] += 1
+                continue
+            digests[card_id] = digest
+            batch.append((card_id, card))
+            if len(batch) == batch_size:
+                # Only concurrency requests are in flight, so the aggregate is streamed rather than read all at once
+                if len(pending) == concurrency:
+                    collect(pending.popleft())
+                pending.append(executor.submit(opensearch.bulk, index, batch, retries))
+                batch = []
+        if batch:
+            pending.append(executor.submit(opensearch.bulk, index, batch, retries))
+        while pending:
+            collect(pending.popleft())
+    # Cards that failed are left out of the state, so they are sent again next time
+    counts["failed"] = len(digests)
+    return counts
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+    if not args.url:
+        parser.error("--url or OPENSEARCH_URL is required")
+    if args.retries < 1:
+        parser.error("--retries must be at least 1")
+    opensearch = OpenSearch(args.url)
+    # Without the credentials
+    fingerprint = loader_fingerprint(opensearch.url, args.index)
+    previous = load_state(args.state, fingerprint) if args.state else {}
+    state: dict[str, str] = {}
+    try:
+        counts = load(
+            opensearch,
+            args.aggregate,
+            args.index,
+            previous,
+            state,
+            args.batch_size,
+            args.concurrency,
+            args.retries,
+        )
+    except BaseException:
+        # Cards not reached yet are still indexed as they were at the previous load
+        state = previous | state
+        raise
+    finally:
+        if args.state:
+            save_state(args.state, fingerprint, state)
+    logger.info(
+        f"Cards indexed: {counts['indexed']}, unchanged: {counts['unchanged']}, failed: {counts['failed']}"
+    )
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
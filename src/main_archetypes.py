@@ -1,4 +1,4 @@
-# SPDX-FileCopyrightText: © 2022 Kevin Lu
+# SPDX-FileCopyrightText: © 2022–2026 Kevin Lu
 # SPDX-Licence-Identifier: AGPL-3.0-or-later
 import logging
 import os
@@ -7,46 +7,65 @@ from argparse import ArgumentParser
 
 from ruamel.yaml import YAML
 
-from common import initial_parse, write
+import parse_cache
+from common import init_parsing, write
+from job_archetypes import job
+from parallel import imap
 
 parser = ArgumentParser()
 parser.add_argument("wikitext_directory", help="yaml-yugipedia archetypes and series")
+parser.add_argument(
+    "--processes", type=int, default=0, help="number of worker processes, default ncpu"
+)
+parser.add_argument(
+    "--verbose", action="store_true", help="log every card and file, not just progress"
+)
+parser.add_argument(
+    "--fast-extraction",
+    action="store_true",
+    help="extract templates with a hand-written tokenizer instead of wikitextparser, which falls back to wikitextparser for markup it does not handle",
+)
+parser.add_argument(
+    "--parse-cache",
+    help="SQLite file caching parsed pages across runs, so that unchanged pages are not parsed again",
+)
+parser.add_argument(
+    "--parse-cache-size",
+    type=int,
+    default=256,
+    help="MiB of parsed pages to keep in --parse-cache, least recently used are evicted first",
+)
 
 logger = logging.getLogger(__name__)
 
 
 def main() -> None:
-    logging.basicConfig(level=logging.INFO)
     args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
     yaml = YAML()
     yaml.width = sys.maxsize
+    files = [
+        os.path.join(args.wikitext_directory, filename)
+        for filename in os.listdir(args.wikitext_directory)
+        if os.path.isfile(os.path.join(args.wikitext_directory, filename))
+    ]
     archetypes_list = []
     archetypes_map = {}
-    for filename in os.listdir(args.wikitext_directory):
-        filepath = os.path.join(args.wikitext_directory, filename)
-        if os.path.isfile(filepath):
-            logger.info(filepath)
-            properties = initial_parse(yaml, filepath, "Infobox archseries")
-            if not properties:
-                logger.info(f"Skip: {filepath}")
-                continue
-            document = {
-                "de": properties.get("de_name"),
-                "es": properties.get("es_name"),
-                "fr": properties.get("fr_name"),
-                "it": properties.get("it_name"),
-                "pt": properties.get("pt_name"),
-                "ja": properties.get("ja_name"),
-                "ja_romaji": properties.get("romaji"),
-                "ko": properties.get("ko_name"),
-                "ko_rr": properties.get("ko_romanized"),
-                "zh-TW": properties.get("tc_name") or properties.get("zh_name"),
-                "zh-CN": properties.get("sc_name"),
-            }
-            archetypes_map[properties.get("en_name")] = document
-            archetypes_list.append({"en": properties.get("en_name"), **document})
+    for result in imap(
+        job,
+        files,
+        args.processes,
+        initializer=init_parsing,
+        initargs=(args.parse_cache, args.fast_extraction),
+    ):
+        if result:
+            en_name, document = result
+            archetypes_map[en_name] = document
+            archetypes_list.append({"en": en_name, **document})
     write(archetypes_map, "map", yaml, logger)
     write(archetypes_list, "list", yaml, logger)
+    if args.parse_cache:
+        parse_cache.evict(args.parse_cache, args.parse_cache_size * 2**20)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,4 @@
-# SPDX-FileCopyrightText: © 2023 Kevin Lu
+# SPDX-FileCopyrightText: © 2023–2026 Kevin Lu
 # SPDX-Licence-Identifier: AGPL-3.0-or-later
 import json
 import logging
@@ -6,37 +6,63 @@ import os
 import sys
 from argparse import ArgumentParser
 
+import parse_cache
+from common import init_parsing
 from job_masterduel import job
+from parallel import imap
 
 parser = ArgumentParser()
 parser.add_argument("wikitext_directory", help="yaml-yugipedia card texts")
 parser.add_argument(
     "--processes", type=int, default=0, help="number of worker processes, default ncpu"
 )
+parser.add_argument(
+    "--verbose", action="store_true", help="log every card and file, not just progress"
+)
+parser.add_argument(
+    "--fast-extraction",
+    action="store_true",
+    help="extract templates with a hand-written tokenizer instead of wikitextparser, which falls back to wikitextparser for markup it does not handle",
+)
+parser.add_argument(
+    "--parse-cache",
+    help="SQLite file caching parsed pages across runs, so that unchanged pages are not parsed again",
+)
+parser.add_argument(
+    "--parse-cache-size",
+    type=int,
+    default=256,
+    help="MiB of parsed pages to keep in --parse-cache, least recently used are evicted first",
+)
 
 logger = logging.getLogger(__name__)
 
 
 def main() -> None:
-    logging.basicConfig(level=logging.INFO)
     args = parser.parse_args()
-    processes = args.processes
-    if processes == 0:
-        processes = os.cpu_count()
-        logger.info(f"Using {processes} processes.")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
 
     files = [
         os.path.join(args.wikitext_directory, filename)
         for filename in os.listdir(args.wikitext_directory)
         if os.path.isfile(os.path.join(args.wikitext_directory, filename))
     ]
-    if processes == 1:
-        cards = map(job, files)
-    else:
-        from multiprocessing import Pool
+    cards = [
+        card
+        for card in imap(
+            job,
+            files,
+            args.processes,
+            ordered=False,
+            minimum_chunk=100,
+            initializer=init_parsing,
+            initargs=(args.parse_cache, args.fast_extraction),
+        )
+        if card
+    ]
 
-        with Pool(processes) as pool:
-            cards = [card for card in pool.imap_unordered(job, files, 100) if card]
+    if args.parse_cache:
+        parse_cache.evict(args.parse_cache, args.parse_cache_size * 2**20)
 
     logger.info("Serializing to JSON")
     json.dump(cards, sys.stdout)
@@ -1,17 +1,48 @@
-# SPDX-FileCopyrightText: © 2022–2024 Kevin Lu
+# SPDX-FileCopyrightText: © 2022–2026 Kevin Lu
 # SPDX-Licence-Identifier: AGPL-3.0-or-later
-import json
 import logging
-import math
 import os
+import sys
+import time
 from argparse import ArgumentParser
+from collections import Counter
+from functools import partial
 
-from job_ocgtcg import job
+from genson import SchemaBuilder
+
+import common
+import job_ocgtcg
+import parse_cache
+import profiling
+from aggregates import (
+    AggregateWriters,
+    add_aggregate_arguments,
+    check_aggregate_arguments,
+)
+from common import (
+    WriteStats,
+    load_manifest,
+    load_schema,
+    log_write_stats,
+    manifest_fingerprint,
+    merge_write_stats,
+    remove_stale_outputs,
+    save_generated_schema,
+    save_manifest,
+    save_validation_report,
+)
+from digest import json_digest
+from job_ocgtcg import init_worker, job, load_side_inputs
+from parallel import imap_chunks
 
 parser = ArgumentParser()
 parser.add_argument("wikitext_directory", help="yaml-yugipedia card texts")
 parser.add_argument("--assignments", help="fake password assignment YAML")
 parser.add_argument("--zh-CN", help="yaml-yugi-zh card texts")
+parser.add_argument(
+    "--zh-CN-cache",
+    help="JSON file caching the --zh-CN texts, reused until a file in the directory changes",
+)
 parser.add_argument("--tcg", help="TCG Forbidden & Limited List, Konami ID vector JSON")
 parser.add_argument(
     "--ocg", help="OCG Forbidden & Limited List, English name vector JSON"
@@ -21,35 +52,103 @@ parser.add_argument(
 )
 parser.add_argument("--ko-official", help="yaml-yugi-ko official database CSV")
 parser.add_argument("--ko-override", help="yaml-yugi-ko ocg-override.csv")
-parser.add_argument("--ko-prerelease", help="yaml-yugi-ko ocg-prerelease.csv")
+parser.add_argument(
+    "--ko-prerelease",
+    help="deprecated and ignored, the OCG/TCG transform does not use yaml-yugi-ko ocg-prerelease.csv",
+)
 parser.add_argument("--master-duel", help="master-duel-raw.json")
 parser.add_argument(
-    "--generate-schema", action="store_true", help="output generated JSON schema file"
+    "--generate-schema", help="output JSON schema file generated from every document"
+)
+parser.add_argument(
+    "--schema",
+    help="JSON Schema to validate every document against before it is written; exit with an error if any fail, unless --validation-report",
+)
+parser.add_argument(
+    "--validation-report",
+    help="output JSON of the documents that failed --schema and why, instead of exiting with an error",
 )
 parser.add_argument(
     "--processes", type=int, default=0, help="number of worker processes, default ncpu"
 )
-parser.add_argument("--aggregate", help="output aggregate JSON file")
+parser.add_argument(
+    "--verbose", action="store_true", help="log every card and file, not just progress"
+)
+parser.add_argument(
+    "--fast-extraction",
+    action="store_true",
+    help="extract templates with a hand-written tokenizer instead of wikitextparser, which falls back to wikitextparser for markup it does not handle",
+)
+parser.add_argument(
+    "--parse-cache",
+    help="SQLite file caching parsed pages across runs, so that unchanged pages are not parsed again",
+)
+parser.add_argument(
+    "--parse-cache-size",
+    type=int,
+    default=256,
+    help="MiB of parsed pages to keep in --parse-cache, least recently used are evicted first",
+)
+add_aggregate_arguments(parser, "page ID, password, Konami ID, and fake password")
+parser.add_argument(
+    "--pipeline",
+    action="store_true",
+    help="read pages ahead and write outputs behind in background threads in each worker",
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="log time spent in each pipeline stage, summed over all processes",
+)
+parser.add_argument("--profile-json", help="output --profile report JSON file")
+parser.add_argument(
+    "--profile-cprofile", help="output cProfile stats for each process to directory"
+)
+parser.add_argument(
+    "--manifest",
+    help="incremental transform manifest JSON; only cards with changed inputs are transformed again",
+)
 
 logger = logging.getLogger(__name__)
 
 
 def main() -> None:
-    logging.basicConfig(level=logging.INFO)
     args = parser.parse_args()
-    processes = args.processes
-    if processes == 0:
-        processes = os.cpu_count()
-        logger.info(f"Using {processes} processes.")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    if args.ko_prerelease:
+        logger.warning("--ko-prerelease is deprecated and ignored")
+    check_aggregate_arguments(
+        parser,
+        args,
+        (
+            "validation_report",
+            "generate_schema",
+            "manifest",
+            "zh_CN_cache",
+            "parse_cache",
+            "profile_json",
+        ),
+        ("profile_cprofile",),
+    )
+    profile = bool(args.profile or args.profile_json or args.profile_cprofile)
+    start = time.perf_counter()
+    if profile:
+        profiling.enable(args.profile_cprofile)
 
-    tcg = None
-    ocg = None
-    if args.tcg:
-        with open(args.tcg) as f:
-            tcg = json.load(f)["regulation"]
-    if args.ocg:
-        with open(args.ocg) as f:
-            ocg = json.load(f)["regulation"]
+    # Parsed once here and shared with the workers
+    with profiling.stage("load side inputs"):
+        side_inputs = load_side_inputs(
+            zh_cn_dir=args.zh_CN,
+            zh_cn_cache=args.zh_CN_cache,
+            assignment_file=args.assignments,
+            tcg_vector_json=args.tcg,
+            ocg_vector_json=args.ocg,
+            unreleased_csv=args.unreleased,
+            ko_official_csv=args.ko_official,
+            ko_override_csv=args.ko_override,
+            master_duel_raw_json=args.master_duel,
+        )
+    schema = load_schema(args.schema)
 
     files = [
         filename
@@ -57,41 +156,87 @@ def main() -> None:
         if os.path.isfile(os.path.join(args.wikitext_directory, filename))
     ]
 
-    arguments = (
-        args.zh_CN,
-        args.assignments,
-        tcg,
-        ocg,
-        args.unreleased,
-        args.ko_official,
-        args.ko_override,
-        args.ko_prerelease,
-        args.master_duel,
-        args.aggregate is not None,
-    )
-    if processes == 1:
-        cards = job(args.wikitext_directory, files, *arguments)
+    if args.manifest:
+        fingerprint = manifest_fingerprint(
+            [common.__file__, job_ocgtcg.__file__],
+            {
+                "zh_CN": args.zh_CN is not None,
+                "assignments": args.assignments is not None,
+                "tcg": args.tcg is not None,
+                "ocg": args.ocg is not None,
+                "unreleased": args.unreleased is not None,
+                "ko_official": args.ko_official is not None,
+                "ko_override": args.ko_override is not None,
+                "master_duel": args.master_duel is not None,
+                # Reused outputs were only validated against the schema at the time
+                "schema": schema and json_digest(schema),
+            },
+        )
+        previous_manifest = load_manifest(args.manifest, fingerprint)
     else:
-        size = math.ceil(len(files) / processes)
-        partitions = [files[i : i + size] for i in range(0, len(files), size)]
-        cards = []
+        previous_manifest = None
 
-        from multiprocessing import Pool
+    manifest = {}
+    stats = WriteStats(set(), Counter(), {})
+    schema_builder = SchemaBuilder()
+    timings: profiling.Timings = {}
+    # Cards arrive already serialized and go straight to disk without being collected
+    with AggregateWriters(args) as aggregates:
+        for chunk, entries, chunk_stats, chunk_schema, chunk_timings in imap_chunks(
+            partial(
+                job,
+                args.wikitext_directory,
+                return_serialized=aggregates.enabled,
+                generate_schema=bool(args.generate_schema),
+                pipeline=args.pipeline,
+            ),
+            files,
+            args.processes,
+            initializer=init_worker,
+            initargs=(
+                side_inputs,
+                previous_manifest,
+                profile,
+                args.profile_cprofile,
+                schema,
+                args.parse_cache,
+                args.fast_extraction,
+            ),
+        ):
+            manifest.update(entries)
+            merge_write_stats(stats, chunk_stats)
+            profiling.merge(timings, chunk_timings)
+            if chunk_schema:
+                schema_builder.add_schema(chunk_schema)
+            aggregates.extend(chunk)
 
-        with Pool(processes) as pool:
-            jobs = [
-                pool.apply_async(job, (args.wikitext_directory, partition, *arguments))
-                for partition in partitions
-            ]
-            for result in jobs:
-                chunk = result.get()
-                if args.aggregate is not None:
-                    cards.extend(chunk)
+    # The manifest covers outputs from before there was a record of them
+    remove_stale_outputs(
+        stats,
+        (
+            entry["basename"]
+            for entry in (previous_manifest or {}).values()
+            if entry["basename"]
+        ),
+    )
+    log_write_stats(stats)
+    if args.parse_cache:
+        parse_cache.evict(args.parse_cache, args.parse_cache_size * 2**20)
+    if args.generate_schema:
+        save_generated_schema(args.generate_schema, schema_builder)
+    if args.manifest:
+        save_manifest(args.manifest, fingerprint, manifest)
 
-    if args.aggregate is not None:
-        logger.info(f"Write: {args.aggregate}")
-        with open(args.aggregate, "w", encoding="utf-8") as out:
-            json.dump(cards, out)
+    if profile:
+        profiling.merge(timings, profiling.collect())
+        wall_time = time.perf_counter() - start
+        profiling.log_summary(timings, wall_time)
+        if args.profile_json:
+            profiling.write_report(args.profile_json, timings, wall_time)
+    if args.validation_report:
+        save_validation_report(args.validation_report, stats.failures)
+    elif stats.failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,31 @@
-# SPDX-FileCopyrightText: © 2022–2024 Kevin Lu
+# SPDX-FileCopyrightText: © 2022–2026 Kevin Lu
 # SPDX-Licence-Identifier: AGPL-3.0-or-later
-import json
 import logging
-import math
 import os
+import sys
 from argparse import ArgumentParser
+from collections import Counter
+from functools import partial
 
-from job_rush import job
+from genson import SchemaBuilder
+
+import parse_cache
+from aggregates import (
+    AggregateWriters,
+    add_aggregate_arguments,
+    check_aggregate_arguments,
+)
+from common import (
+    WriteStats,
+    load_schema,
+    log_write_stats,
+    merge_write_stats,
+    remove_stale_outputs,
+    save_generated_schema,
+    save_validation_report,
+)
+from job_rush import init_worker, job, load_side_inputs
+from parallel import imap_chunks
 
 parser = ArgumentParser()
 parser.add_argument("wikitext_directory", help="yaml-yugipedia card texts")
@@ -15,23 +34,54 @@ parser.add_argument("--ko-override", help="yaml-yugi-ko rush-override.csv")
 parser.add_argument("--ko-prerelease", help="yaml-yugi-ko rush-prerelease.csv")
 parser.add_argument("--ocg-aggregate", help="cards.json")
 parser.add_argument(
-    "--generate-schema", action="store_true", help="output generated JSON schema file"
+    "--generate-schema", help="output JSON schema file generated from every document"
+)
+parser.add_argument(
+    "--schema",
+    help="JSON Schema to validate every document against before it is written; exit with an error if any fail, unless --validation-report",
+)
+parser.add_argument(
+    "--validation-report",
+    help="output JSON of the documents that failed --schema and why, instead of exiting with an error",
 )
 parser.add_argument(
     "--processes", type=int, default=0, help="number of worker processes, default ncpu"
 )
-parser.add_argument("--aggregate", help="output aggregate JSON file")
+parser.add_argument(
+    "--verbose", action="store_true", help="log every card and file, not just progress"
+)
+parser.add_argument(
+    "--fast-extraction",
+    action="store_true",
+    help="extract templates with a hand-written tokenizer instead of wikitextparser, which falls back to wikitextparser for markup it does not handle",
+)
+parser.add_argument(
+    "--parse-cache",
+    help="SQLite file caching parsed pages across runs, so that unchanged pages are not parsed again",
+)
+parser.add_argument(
+    "--parse-cache-size",
+    type=int,
+    default=256,
+    help="MiB of parsed pages to keep in --parse-cache, least recently used are evicted first",
+)
+add_aggregate_arguments(parser, "page ID and Konami ID")
 
 logger = logging.getLogger(__name__)
 
 
 def main() -> None:
-    logging.basicConfig(level=logging.INFO)
     args = parser.parse_args()
-    processes = args.processes
-    if processes == 0:
-        processes = os.cpu_count()
-        logger.info(f"Using {processes} processes.")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    check_aggregate_arguments(
+        parser,
+        args,
+        (
+            "validation_report",
+            "generate_schema",
+            "parse_cache",
+        ),
+    )
 
     files = [
         filename
@@ -39,36 +89,45 @@ def main() -> None:
         if os.path.isfile(os.path.join(args.wikitext_directory, filename))
     ]
 
-    arguments = (
-        args.ko_official,
-        args.ko_override,
-        args.ko_prerelease,
-        args.ocg_aggregate,
-        args.aggregate is not None,
+    # Parsed once here and shared with the workers
+    side_inputs = load_side_inputs(
+        ko_override_csv=args.ko_override,
+        ko_prerelease_csv=args.ko_prerelease,
+        ocg_aggregate=args.ocg_aggregate,
     )
-    if processes == 1:
-        cards = job(args.wikitext_directory, files, *arguments)
-    else:
-        size = math.ceil(len(files) / processes)
-        partitions = [files[i : i + size] for i in range(0, len(files), size)]
-        cards = []
-
-        from multiprocessing import Pool
+    schema = load_schema(args.schema)
 
-        with Pool(processes) as pool:
-            jobs = [
-                pool.apply_async(job, (args.wikitext_directory, partition, *arguments))
-                for partition in partitions
-            ]
-            for result in jobs:
-                chunk = result.get()
-                if args.aggregate is not None:
-                    cards.extend(chunk)
+    stats = WriteStats(set(), Counter(), {})
+    schema_builder = SchemaBuilder()
+    # Cards arrive already serialized and go straight to disk without being collected
+    with AggregateWriters(args) as aggregates:
+        for chunk, chunk_stats, chunk_schema in imap_chunks(
+            partial(
+                job,
+                args.wikitext_directory,
+                return_serialized=aggregates.enabled,
+                generate_schema=bool(args.generate_schema),
+            ),
+            files,
+            args.processes,
+            initializer=init_worker,
+            initargs=(side_inputs, schema, args.parse_cache, args.fast_extraction),
+        ):
+            merge_write_stats(stats, chunk_stats)
+            if chunk_schema:
+                schema_builder.add_schema(chunk_schema)
+            aggregates.extend(chunk)
 
-    if args.aggregate is not None:
-        logger.info(f"Write: {args.aggregate}")
-        with open(args.aggregate, "w", encoding="utf-8") as out:
-            json.dump(cards, out)
+    remove_stale_outputs(stats)
+    log_write_stats(stats)
+    if args.parse_cache:
+        parse_cache.evict(args.parse_cache, args.parse_cache_size * 2**20)
+    if args.generate_schema:
+        save_generated_schema(args.generate_schema, schema_builder)
+    if args.validation_report:
+        save_validation_report(args.validation_report, stats.failures)
+    elif stats.failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
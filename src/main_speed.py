@@ -1,73 +1,124 @@
-# SPDX-FileCopyrightText: © 2022 Kevin Lu
+# SPDX-FileCopyrightText: © 2022–2026 Kevin Lu
 # SPDX-Licence-Identifier: AGPL-3.0-or-later
-import json
 import logging
 import os
 import sys
 from argparse import ArgumentParser
-from typing import Any
+from collections import Counter
+from functools import partial
 
-from ruamel.yaml import YAML
+from genson import SchemaBuilder
 
+import parse_cache
+from aggregates import (
+    AggregateWriters,
+    add_aggregate_arguments,
+    check_aggregate_arguments,
+)
 from common import (
-    initial_parse,
-    int_or_og,
-    transform_multilanguage,
-    transform_names,
-    transform_sets,
-    write,
+    WriteStats,
+    load_schema,
+    log_write_stats,
+    merge_write_stats,
+    remove_stale_outputs,
+    save_generated_schema,
+    save_validation_report,
 )
+from job_speed import init_worker, job
+from parallel import imap_chunks
 
 parser = ArgumentParser()
 parser.add_argument("wikitext_directory", help="yaml-yugipedia card texts")
 parser.add_argument(
-    "--generate-schema", action="store_true", help="output generated JSON schema file"
+    "--generate-schema", help="output JSON schema file generated from every document"
+)
+parser.add_argument(
+    "--schema",
+    help="JSON Schema to validate every document against before it is written; exit with an error if any fail, unless --validation-report",
+)
+parser.add_argument(
+    "--validation-report",
+    help="output JSON of the documents that failed --schema and why, instead of exiting with an error",
+)
+parser.add_argument(
+    "--processes", type=int, default=0, help="number of worker processes, default ncpu"
+)
+parser.add_argument(
+    "--verbose", action="store_true", help="log every card and file, not just progress"
 )
-parser.add_argument("--aggregate", help="output aggregate JSON file")
+parser.add_argument(
+    "--fast-extraction",
+    action="store_true",
+    help="extract templates with a hand-written tokenizer instead of wikitextparser, which falls back to wikitextparser for markup it does not handle",
+)
+parser.add_argument(
+    "--parse-cache",
+    help="SQLite file caching parsed pages across runs, so that unchanged pages are not parsed again",
+)
+parser.add_argument(
+    "--parse-cache-size",
+    type=int,
+    default=256,
+    help="MiB of parsed pages to keep in --parse-cache, least recently used are evicted first",
+)
+add_aggregate_arguments(parser, "page ID")
 
 logger = logging.getLogger(__name__)
 
 
-def transform_structure(wikitext: dict[str, str]) -> dict[str, Any] | None:
-    return {
-        "name": transform_names(wikitext),
-        "type_line": wikitext["types"],
-        "activation": transform_multilanguage(wikitext, "skill_activation"),
-        "effect": transform_multilanguage(wikitext, "text"),
-        "character": wikitext.get("character"),  # bonus field
-        "image_front": wikitext.get("image"),
-        "image_back": wikitext.get("image2"),
-        "sets": transform_sets(wikitext),
-        "yugipedia_page_id": wikitext.get("yugipedia_page_id"),
-    }
-
-
 def main() -> None:
-    logging.basicConfig(level=logging.INFO)
     args = parser.parse_args()
-    yaml = YAML()
-    yaml.width = sys.maxsize
-    skills = []
-    for filename in os.listdir(args.wikitext_directory):
-        filepath = os.path.join(args.wikitext_directory, filename)
-        if os.path.isfile(filepath):
-            logger.info(filepath)
-            basename = os.path.splitext(filename)[0]
-            page_id = int_or_og(basename)
-            properties = initial_parse(yaml, filepath)
-            if not properties:
-                logger.info(f"Skip: {filepath}")
-                continue
-            properties["yugipedia_page_id"] = page_id
-            skill = transform_structure(properties)
-            write(skill, f"yugipedia{page_id}", yaml, logger)
-            if args.aggregate is not None:
-                skills.append(skill)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    check_aggregate_arguments(
+        parser,
+        args,
+        (
+            "validation_report",
+            "generate_schema",
+            "parse_cache",
+        ),
+    )
+
+    files = [
+        filename
+        for filename in os.listdir(args.wikitext_directory)
+        if os.path.isfile(os.path.join(args.wikitext_directory, filename))
+    ]
 
-    if args.aggregate is not None:
-        logger.info(f"Write: {args.aggregate}")
-        with open(args.aggregate, "w", encoding="utf-8") as out:
-            json.dump(skills, out)
+    stats = WriteStats(set(), Counter(), {})
+    schema_builder = SchemaBuilder()
+    # Skills arrive already serialized and go straight to disk without being collected
+    with AggregateWriters(args) as aggregates:
+        for chunk, chunk_stats, chunk_schema in imap_chunks(
+            partial(
+                job,
+                args.wikitext_directory,
+                return_serialized=aggregates.enabled,
+                generate_schema=bool(args.generate_schema),
+            ),
+            files,
+            args.processes,
+            initializer=init_worker,
+            initargs=(
+                load_schema(args.schema),
+                args.parse_cache,
+                args.fast_extraction,
+            ),
+        ):
+            merge_write_stats(stats, chunk_stats)
+            if chunk_schema:
+                schema_builder.add_schema(chunk_schema)
+            aggregates.extend(chunk)
+    remove_stale_outputs(stats)
+    log_write_stats(stats)
+    if args.parse_cache:
+        parse_cache.evict(args.parse_cache, args.parse_cache_size * 2**20)
+    if args.generate_schema:
+        save_generated_schema(args.generate_schema, schema_builder)
+    if args.validation_report:
+        save_validation_report(args.validation_report, stats.failures)
+    elif stats.failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
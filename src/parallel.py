@@ -0,0 +1,107 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+import logging
+import os
+import time
+from collections.abc import Callable, Iterator
+from functools import partial
+from multiprocessing import Pool
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between progress messages
+PROGRESS_INTERVAL = 10
+
+
+# Guided self-scheduling: chunks start large to keep per-task overhead low, then shrink towards the end so that a
+# worker stuck on heavy pages (e.g. Pendulum Monsters with long set lists) does not leave the others idle
+def guided_chunks(items: list[T], processes: int, minimum: int) -> Iterator[list[T]]:
+    start = 0
+    while start < len(items):
+        size = max(minimum, (len(items) - start) // (2 * processes))
+        yield items[start : start + size]
+        start += size
+
+
+class Progress:
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.last = time.monotonic()
+
+    def update(self, count: int) -> None:
+        self.done += count
+        now = time.monotonic()
+        if self.done == self.total or now - self.last >= PROGRESS_INTERVAL:
+            self.last = now
+            logger.info(f"Progress: {self.done}/{self.total}")
+
+
+def call_counted(function: Callable[[list[T]], R], chunk: list[T]) -> tuple[int, R]:
+    return len(chunk), function(chunk)
+
+
+# Calls function on chunks of items across a process pool and yields each return value as it becomes available.
+# Idle workers pull the next chunk from the shared task queue, so work is balanced dynamically. With ordered, results
+# are yielded in the order of items, otherwise in order of completion. processes = 0 uses every CPU, and processes = 1
+# calls function on the chunks in this process without a pool. Progress is logged at most every PROGRESS_INTERVAL.
+def imap_chunks(
+    function: Callable[[list[T]], R],
+    items: list[T],
+    processes: int = 0,
+    ordered: bool = True,
+    minimum_chunk: int = 16,
+    initializer: Callable[..., None] | None = None,
+    initargs: tuple[Any, ...] = (),
+) -> Iterator[R]:
+    if processes == 0:
+        processes = os.cpu_count()
+        logger.info(f"Using {processes} processes.")
+    progress = Progress(len(items))
+    chunks = guided_chunks(items, processes, minimum_chunk)
+    if processes == 1:
+        if initializer:
+            initializer(*initargs)
+        for chunk in chunks:
+            yield function(chunk)
+            progress.update(len(chunk))
+        return
+    with Pool(processes, initializer, initargs) as pool:
+        counted = partial(call_counted, function)
+        if ordered:
+            results = pool.imap(counted, chunks)
+        else:
+            results = pool.imap_unordered(counted, chunks)
+        for count, result in results:
+            yield result
+            progress.update(count)
+
+
+def call_each(function: Callable[[T], R], chunk: list[T]) -> list[R]:
+    return [function(item) for item in chunk]
+
+
+# Like imap_chunks, but for a function called on each item
+def imap(
+    function: Callable[[T], R],
+    items: list[T],
+    processes: int = 0,
+    ordered: bool = True,
+    minimum_chunk: int = 16,
+    initializer: Callable[..., None] | None = None,
+    initargs: tuple[Any, ...] = (),
+) -> Iterator[R]:
+    for results in imap_chunks(
+        partial(call_each, function),
+        items,
+        processes,
+        ordered,
+        minimum_chunk,
+        initializer,
+        initargs,
+    ):
+        yield from results
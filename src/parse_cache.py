@@ -0,0 +1,92 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+#
+# Persistent cache of initial_parse results in SQLite, shared by every entry point and every worker process. Entries are
+# keyed by the content of the page, the target template, and the version of the parsing code, so a changed page or
+# parser is simply a miss. Entries that are not used for a while, e.g. for old revisions of pages, are evicted
+# least-recently-used first once the cache grows past its size limit.
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Set in each process by enable, since SQLite connections cannot be shared across processes
+connection: sqlite3.Connection | None = None
+version = ""
+# Recorded as the last use of every entry read or written during this run
+now = 0
+# Last use is only recorded again after this many seconds, since writing it back on every hit costs more than the
+# lookup itself and eviction does not need to be more precise
+TOUCH_INTERVAL = 24 * 60 * 60
+# Sentinel for a page not in the cache, since None is cached for pages without the target template
+MISS = object()
+
+
+def enable(filename: str | None, parser_version: str) -> None:
+    global connection, version, now
+    if not filename:
+        return
+    # In autocommit mode, each statement commits on its own. Pool workers are terminated rather than exited, so there
+    # is no chance to commit a batch at the end.
+    connection = sqlite3.connect(filename, timeout=60, isolation_level=None)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS pages "
+        "(key BLOB PRIMARY KEY, properties TEXT NOT NULL, used INTEGER NOT NULL) "
+        "WITHOUT ROWID"
+    )
+    version = parser_version
+    now = int(time.time())
+
+
+def key(content: bytes, target: str) -> bytes:
+    digest = hashlib.sha256(content)
+    digest.update(f"\0{target}\0{version}".encode())
+    return digest.digest()
+
+
+def get(page_key: bytes) -> Any:
+    row = connection.execute(
+        "SELECT properties, used FROM pages WHERE key = ?", (page_key,)
+    ).fetchone()
+    if row is None:
+        return MISS
+    properties, used = row
+    if now - used >= TOUCH_INTERVAL:
+        connection.execute("UPDATE pages SET used = ? WHERE key = ?", (now, page_key))
+    return json.loads(properties)
+
+
+def put(page_key: bytes, properties: dict[str, Any] | None) -> None:
+    connection.execute(
+        "INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+        (page_key, json.dumps(properties, ensure_ascii=False), now),
+    )
+
+
+# Deletes the least recently used entries beyond max_bytes of properties. Called once in the parent after a run.
+def evict(filename: str, max_bytes: int) -> None:
+    with sqlite3.connect(filename, timeout=60, isolation_level=None) as db:
+        count, size = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(properties AS BLOB))), 0) FROM pages"
+        ).fetchone()
+        deleted = db.execute(
+            "DELETE FROM pages WHERE key IN (SELECT key FROM "
+            "(SELECT key, SUM(LENGTH(CAST(properties AS BLOB))) OVER (ORDER BY used DESC, key) AS total FROM pages) "
+            "WHERE total > ?)",
+            (max_bytes,),
+        ).rowcount
+        # Fold the write-ahead log back into the database file so that it is complete on its own, e.g. for CI caches
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if deleted:
+            # Otherwise the file keeps its size, since SQLite only reuses the freed pages
+            db.execute("VACUUM")
+    db.close()
+    logger.info(
+        f"Parse cache: {count - deleted} entries, {deleted} evicted, {size / 2**20:.1f} MiB before eviction"
+    )
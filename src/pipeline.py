@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+#
+# Background threads for a worker, so that the main thread only does the CPU-bound parsing and transforming while file
+# reads and writes wait on the filesystem. File I/O releases the GIL, so the threads overlap with the main thread.
+# Reads run at most PREFETCH files ahead and writes at most WRITE_BACKLOG files behind. With profiling enabled, the
+# time the main thread spends blocked on either is recorded under the "pipeline" stages.
+from collections import Counter, deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any
+
+import profiling
+
+# Files read ahead of the main thread
+PREFETCH = 32
+# Serialized outputs waiting to be written
+WRITE_BACKLOG = 64
+
+
+def read_file(filename: str) -> bytes:
+    with profiling.stage("pipeline: read"), open(filename, "rb") as f:
+        return f.read()
+
+
+# Yields the content of each file in order, reading ahead in a background thread. Errors are raised when the main
+# thread gets to the file.
+def prefetch(filenames: list[str], depth: int = PREFETCH) -> Iterator[bytes]:
+    with ThreadPoolExecutor(1, "prefetch") as executor:
+        remaining = iter(filenames)
+        pending = deque(
+            executor.submit(read_file, filename)
+            for filename in islice(remaining, depth)
+        )
+        while pending:
+            with profiling.stage("pipeline: main blocked on read"):
+                content = pending.popleft().result()
+            filename = next(remaining, None)
+            if filename is not None:
+                pending.append(executor.submit(read_file, filename))
+            yield content
+
+
+# Calls function(*args) in a background thread for each put, in order, counting what it returns, e.g. written or
+# unchanged. Errors are raised in the main thread by a later put or by close.
+class BackgroundWriter:
+    def __init__(self, function: Callable[..., str], depth: int = WRITE_BACKLOG):
+        self.function = function
+        self.depth = depth
+        self.counts: Counter[str] = Counter()
+        self.executor = ThreadPoolExecutor(1, "writer")
+        self.pending: deque[Future[str]] = deque()
+
+    def put(self, *args: Any) -> None:
+        if len(self.pending) >= self.depth:
+            with profiling.stage("pipeline: main blocked on write"):
+                self.counts[self.pending.popleft().result()] += 1
+        self.pending.append(self.executor.submit(self.function, *args))
+
+    # Waits for every write to finish and returns the counts
+    def close(self) -> Counter[str]:
+        with profiling.stage("pipeline: main blocked on write"):
+            while self.pending:
+                self.counts[self.pending.popleft().result()] += 1
+        self.executor.shutdown()
+        return self.counts
@@ -0,0 +1,125 @@
+# SPDX-FileCopyrightText: © 2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
+#
+# Opt-in per-stage timing for the transform pipeline. Each process accumulates wall time and call counts per stage in
+# module state. Workers hand theirs back with every chunk of work via collect, and the parent merges them. Stages may be
+# nested, e.g. template expansion happens within template extraction, so their times are inclusive and overlap.
+import cProfile
+import json
+import logging
+import os
+import time
+from contextlib import nullcontext
+from multiprocessing import current_process
+
+logger = logging.getLogger(__name__)
+
+# stage: [seconds, calls]
+Timings = dict[str, list[float | int]]
+
+enabled = False
+timings: Timings = {}
+profiler: cProfile.Profile | None = None
+profile_dir: str | None = None
+# Process that the timings and profiler belong to, since forked workers inherit the parent's
+owner: int | None = None
+DISABLED = nullcontext()
+
+
+class Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        elapsed = time.perf_counter() - self.start
+        entry = timings.get(self.name)
+        if entry:
+            entry[0] += elapsed
+            entry[1] += 1
+        else:
+            timings[self.name] = [elapsed, 1]
+
+
+# with stage("name"): ... times the block if profiling is enabled in this process, and does nothing otherwise
+def stage(name: str) -> Stage | nullcontext:
+    return Stage(name) if enabled else DISABLED
+
+
+# Called in the parent and in every worker. With directory, also runs cProfile and dumps its stats there per process.
+def enable(directory: str | None = None) -> None:
+    global enabled, timings, profiler, profile_dir, owner
+    enabled = True
+    if owner != os.getpid():
+        # In a forked worker, drop what the parent recorded before the fork, which the parent reports itself
+        owner = os.getpid()
+        timings = {}
+        if profiler:
+            profiler.disable()
+            profiler = None
+    # Already running in this process, when the parent also does the work without a pool
+    if directory and not profiler:
+        os.makedirs(directory, exist_ok=True)
+        profile_dir = directory
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+
+# Returns and resets the timings accumulated in this process since the last call, or None if profiling is disabled.
+# Pool workers are terminated rather than exited, so the cProfile stats so far are dumped on every call instead.
+def collect() -> Timings | None:
+    global timings
+    if not enabled:
+        return
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(profile_dir, f"{current_process().name}.prof"))
+        profiler.enable()
+    collected = timings
+    timings = {}
+    return collected
+
+
+def merge(total: Timings, other: Timings | None) -> None:
+    if not other:
+        return
+    for name, (seconds, calls) in other.items():
+        entry = total.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+
+def log_summary(total: Timings, wall_time: float) -> None:
+    width = max((len(name) for name in total), default=5)
+    lines = [
+        f"Profile, {wall_time:.2f} s wall time, stage times summed over all processes",
+        f"{'stage':<{width}} {'seconds':>10} {'calls':>8} {'µs/call':>10}",
+    ]
+    for name, (seconds, calls) in sorted(
+        total.items(), key=lambda item: item[1][0], reverse=True
+    ):
+        lines.append(
+            f"{name:<{width}} {seconds:>10.3f} {calls:>8} {seconds / calls * 1e6:>10.1f}"
+        )
+    logger.info("\n".join(lines))
+
+
+def write_report(filename: str, total: Timings, wall_time: float) -> None:
+    logger.info(f"Write: {filename}")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "wall_time": wall_time,
+                "stages": {
+                    name: {"seconds": seconds, "calls": calls}
+                    for name, (seconds, calls) in total.items()
+                },
+            },
+            f,
+            indent=2,
+            sort_keys=True,
+        )
@@ -1,35 +1,214 @@
+# SPDX-FileCopyrightText: © 2023–2026 Kevin Lu
+# SPDX-Licence-Identifier: AGPL-3.0-or-later
 import json
 import logging
 import os
-import sys
+import subprocess
+from argparse import ArgumentParser
+from collections.abc import Callable
+from typing import Any
 
 from fastjsonschema import JsonSchemaValueException, compile
 
+from digest import file_digest, json_digest
+from parallel import imap_chunks
+
+parser = ArgumentParser(
+    description="Validate JSON documents against a JSON Schema across a process pool"
+)
+parser.add_argument("schema", help="JSON Schema file")
+parser.add_argument(
+    "target",
+    nargs="?",
+    default=".",
+    help="directory of JSON documents, or an NDJSON or JSON array aggregate file",
+)
+parser.add_argument(
+    "--processes", type=int, default=0, help="number of worker processes to use"
+)
+parser.add_argument(
+    "--since",
+    help="only validate documents in the directory changed since this git revision",
+)
+parser.add_argument(
+    "--manifest",
+    help="incremental validation manifest JSON; only documents changed since they last passed are validated again",
+)
+
 logger = logging.getLogger(__name__)
 
+# (document name, error message)
+Errors = list[tuple[str, str]]
 
-def validate_documents(schema_path: str, document_dir: str) -> None:
-    with open(schema_path) as handle:
-        validate = compile(json.load(handle))
-    errors: list[tuple[str, JsonSchemaValueException]] = []
+# Set in each worker by init_worker, since compiled validators cannot be pickled
+validate: Callable[[Any], Any] | None = None
+# Digests of the documents that passed in the previous run, or None if not running incrementally
+previous_manifest: dict[str, str] | None = None
+
+
+def init_worker(schema: dict[str, Any], manifest: dict[str, str] | None = None) -> None:
+    global validate, previous_manifest
+    validate = compile(schema)
+    previous_manifest = manifest
+
+
+def validate_one(name: str, document: Any, errors: Errors) -> bool:
+    try:
+        validate(document)
+        return True
+    except JsonSchemaValueException as e:
+        errors.append((name, e.message))
+        return False
+
+
+# Returns the errors and, if running incrementally, the digests of the documents that passed
+def validate_files(paths: list[str]) -> tuple[Errors, dict[str, str]]:
+    errors = []
+    passed = {}
+    for path in paths:
+        if previous_manifest is not None:
+            digest = file_digest(path)
+            if previous_manifest.get(path) == digest:
+                logger.debug("Unchanged, skip: %s", path)
+                passed[path] = digest
+                continue
+        logger.debug("%s", path)
+        with open(path) as handle:
+            document = json.load(handle)
+        if validate_one(os.path.basename(path), document, errors) and (
+            previous_manifest is not None
+        ):
+            passed[path] = digest
+    return errors, passed
+
+
+# Lines are numbered from 1 for the error messages
+def validate_lines(lines: list[tuple[int, str]]) -> tuple[Errors, dict[str, str]]:
+    errors = []
+    for number, line in lines:
+        validate_one(f"line {number}", json.loads(line), errors)
+    return errors, {}
+
+
+def validate_array(documents: list[tuple[int, Any]]) -> tuple[Errors, dict[str, str]]:
+    errors = []
+    for index, document in documents:
+        validate_one(f"[{index}]", document, errors)
+    return errors, {}
+
+
+def list_documents(document_dir: str) -> list[str]:
+    paths = []
     for root, dirs, files in os.walk(document_dir):
         for file in files:
             if file.endswith(".json"):
-                path = os.path.join(root, file)
-                with open(path) as handle:
-                    document = json.load(handle)
-                logger.info(path)
-                try:
-                    validate(document)
-                except JsonSchemaValueException as e:
-                    errors.append((file, e))
-    for file, error in errors:
-        logger.error(f"{file}: {error.message}")
+                paths.append(os.path.join(root, file))
+    return sorted(paths)
+
+
+# JSON documents in the directory added or modified since the revision, including untracked ones
+def list_changed_documents(document_dir: str, revision: str) -> list[str]:
+    changed = subprocess.run(
+        ["git", "diff", "--name-only", "--relative", "--diff-filter=d", revision]
+        + ["--", "."],
+        cwd=document_dir,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.splitlines()
+    changed += subprocess.run(
+        ["git", "ls-files", "--others", "--exclude-standard", "--", "."],
+        cwd=document_dir,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.splitlines()
+    return sorted(
+        os.path.join(document_dir, path)
+        for path in set(changed)
+        if path.endswith(".json")
+    )
+
+
+def load_validation_manifest(filename: str, fingerprint: str) -> dict[str, str]:
+    try:
+        with open(filename) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        logger.info(f"No manifest at {filename}, validating everything")
+        return {}
+    if manifest.get("fingerprint") != fingerprint:
+        logger.info("Schema changed since the manifest, validating everything")
+        return {}
+    return manifest["files"]
+
+
+def validate_documents(
+    schema_path: str,
+    target: str,
+    processes: int = 0,
+    since: str | None = None,
+    manifest_path: str | None = None,
+) -> None:
+    with open(schema_path) as handle:
+        schema = json.load(handle)
+    fingerprint = json_digest(schema)
+    manifest = (
+        load_validation_manifest(manifest_path, fingerprint) if manifest_path else None
+    )
+    if os.path.isdir(target):
+        paths = (
+            list_changed_documents(target, since) if since else list_documents(target)
+        )
+        function = validate_files
+        items = paths
+    elif target.endswith(".ndjson"):
+        # Stream the lines to the workers rather than parsing every document here
+        with open(target) as handle:
+            items = [
+                (number, line)
+                for number, line in enumerate(handle, 1)
+                if not line.isspace()
+            ]
+        function = validate_lines
+    else:
+        with open(target) as handle:
+            items = list(enumerate(json.load(handle)))
+        function = validate_array
+    logger.info(f"Validating {len(items)} document(s) in {target}")
+
+    errors: Errors = []
+    passed: dict[str, str] = {}
+    for chunk_errors, chunk_passed in imap_chunks(
+        function,
+        items,
+        processes,
+        ordered=False,
+        minimum_chunk=64,
+        initializer=init_worker,
+        initargs=(schema, manifest),
+    ):
+        errors.extend(chunk_errors)
+        passed.update(chunk_passed)
+    if manifest is not None:
+        # Documents outside this run, e.g. with --since, keep their earlier results
+        manifest.update(passed)
+        logger.info(f"Write: {manifest_path}")
+        with open(manifest_path, "w", encoding="utf-8") as out:
+            json.dump({"fingerprint": fingerprint, "files": manifest}, out)
+    for name, message in sorted(errors):
+        logger.error(f"{name}: {message}")
     if len(errors):
         raise JsonSchemaValueException(f"{len(errors)} file(s) failed to validate")
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    target = sys.argv[2] if len(sys.argv) > 2 else "."
-    validate_documents(sys.argv[1], target)
+    args = parser.parse_args()
+    if args.since and not os.path.isdir(args.target):
+        parser.error("--since requires a directory of documents")
+    if args.manifest and not os.path.isdir(args.target):
+        parser.error("--manifest requires a directory of documents")
+    validate_documents(
+        args.schema, args.target, args.processes, args.since, args.manifest
+    )